@@ -1,10 +1,24 @@
-from typing import Callable
+import queue
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from communication import AIDetectorMessages, ServerMessages, connect_to_server
+from communication import (AIDetectorMessages, Endpoint, FrameReader, HelperError, ServerMessages, address_from_argv,
+                           connect_to_server, serve_handlers_at)
+from in_process_helpers import capture_helper
 
 
-def ai_detector_server(detector_function: Callable[[str], float],
-                       server_address: str = "localhost", server_port: int = 8080):
+def _estimate_token_count(text: str) -> int:
+    return len(text.split())
+
+
+def ai_detector_server(detector_function: Optional[Callable[[str], float]] = None,
+                       server_address: str = "localhost", server_port: int = 8080,
+                       batch_function: Optional[Callable[[List[str]], List[float]]] = None,
+                       max_batch_size: Optional[int] = None, max_batch_delay: float = 0.05,
+                       length_function: Callable[[str], int] = _estimate_token_count, bucket_width: int = 64,
+                       listen_address: Optional[str] = None):
     """
     A helper function for the AI detector.
     Performs the task of receiving data from the server, calculating the change of it being AI generated and sending the
@@ -18,35 +32,256 @@ def ai_detector_server(detector_function: Callable[[str], float],
 
     If that is not the case, then the general flow of this helper can be seen in its implementation.
 
+    If a text cannot be handled, the detector function can raise a `HelperError` saying why, which is sent to the
+     handler server in place of the result, the same as for `paraphraser_server`.
+
+    If the detector is faster on several texts at once, such as a model running batched inference, a batch function
+     can be passed instead, or as well.
+    It is used for batches of texts and the detector function, if given, for single texts.
+
+    Giving a maximum batch size turns on dynamic batching, where the texts received are regrouped rather than handled in
+     the batches they arrived in.
+    Texts of similar length are queued together in buckets, so a short text is not padded to the length of a long one.
+    A bucket is run as a batch once it holds the maximum batch size or its oldest text has waited for the maximum
+     delay.
+    This only has texts to regroup if the handler server has several requests in flight, so its request window should
+     be a few times the maximum batch size.
+
+    Giving a listen address runs the helper as a daemon instead, which listens for handler servers to connect rather
+     than connecting to one, and serves one run after another without exiting.
+    The handler server attaches to it with `--attach-ai-detector`.
+
+    If the handler server is run with `--in-process`, it loads the helper file itself and this returns straight away,
+     leaving the handler server to call the functions directly, without dynamic batching.
+
     :param detector_function: A function that takes text and returns a change of it being AI generated.
-    :param server_address: The address of the handler server to connect to.
-    :param server_port: The port of the handler server to connect to.
+    :param server_address:
+        The address of the handler server to connect to, unless the handler server started this helper and gave its
+         endpoint after `--connect` on the command line.
+    :param server_port: The port of the handler server to connect to, unless given an endpoint in the same way.
+    :param batch_function:
+        A function that takes a list of texts and returns a list of chances of each being AI generated, in the same
+         order.
+    :param max_batch_size: The largest batch to run when dynamic batching, or None to not dynamically batch.
+    :param max_batch_delay: The longest time in seconds a text waits for its batch to fill when dynamic batching.
+    :param length_function:
+        A function that takes a text and returns its length, such as its number of tokens, when dynamic batching.
+        Defaults to a rough estimate of the number of tokens.
+    :param bucket_width: The range of lengths that are batched together when dynamic batching.
+    :param listen_address:
+        The endpoint to listen on as a daemon, written as `host:port` or `unix:path`.
+        Defaults to the address after `--listen` on the command line, and if that is not given the helper is not run as
+         a daemon.
+    :raises ValueError: If neither a detector function nor a batch function is given.
     """
 
-    # Connect to the handler server
-    sock = connect_to_server(server_address, server_port)
+    if detector_function is None and batch_function is None:
+        raise ValueError("Either a detector function or a batch function must be given")
+    if max_batch_size is not None and max_batch_size < 1:
+        raise ValueError(f"The maximum batch size must be at least 1, got {max_batch_size}")
+
+    # When the handler server runs this helper in its own process, it calls the functions itself
+    if capture_helper(function=detector_function, batch_function=batch_function, convert=float):
+        return
+
+    if listen_address is None:
+        listen_address = address_from_argv("--listen")
+
+    def serve_handler(sock: socket.socket) -> None:
+        _serve_handler(sock, detector_function, batch_function, max_batch_size, max_batch_delay, length_function,
+                       bucket_width)
+
+    if listen_address is not None:
+        # As a daemon, keeping whatever has been loaded between handler servers
+        serve_handlers_at(listen_address, serve_handler)
+        return
+
+    # Connect to the handler server, at the endpoint it gave if it started this helper
+    connect_address = address_from_argv("--connect")
+    if connect_address is not None:
+        sock = Endpoint.parse(connect_address).connect()
+    else:
+        sock = connect_to_server(server_address, server_port)
+    serve_handler(sock)
+    sock.close()
+
+
+def _serve_handler(sock: socket.socket, detector_function: Optional[Callable[[str], float]],
+                   batch_function: Optional[Callable[[List[str]], List[float]]], max_batch_size: Optional[int],
+                   max_batch_delay: float, length_function: Callable[[str], int], bucket_width: int) -> None:
+    frame_reader = FrameReader(sock)
+
+    # Tell the handler server this helper is ready, as anything it needs is loaded before this function is called
+    sock.sendall(AIDetectorMessages.READY.create_message())
+
+    if max_batch_size is not None:
+        _dynamic_batching_server(sock, frame_reader, detector_function, batch_function, max_batch_size,
+                                 max_batch_delay, length_function, bucket_width)
+        return
 
     while True:
         # Receive a message from the handler sever
-        indicator = ServerMessages.read_indicator_from(sock)
-        message = indicator.read_rest_of_message_from(sock)
+        message = frame_reader.read_message(ServerMessages)
 
         if message.type == ServerMessages.DATA:
             # Get the string
             string = message.data
 
-            # Calculate the change of it being AI generated
-            percentage_change_ai = detector_function(string)
+            # Calculate the change of it being AI generated, or get the error saying why it could not be
+            percentage_change_ai, = _detect([string], detector_function, batch_function)
 
-            # Send the result back to the handler server
-            bytes_to_send = AIDetectorMessages.DATA.create_message(percentage_change_ai)
+            # Send the result back to the handler server, answering the same request ID
+            bytes_to_send = _answer_bytes([message.request_id], [percentage_change_ai])
+            sock.sendall(bytes_to_send)
+
+            # Repeat
+            continue
+
+        elif message.type == ServerMessages.BATCH_DATA:
+            # Get the strings
+            strings = message.data
+
+            # Calculate the change of each being AI generated, or get the errors saying why they could not be
+            percentages_change_ai = _detect(strings, detector_function, batch_function)
+
+            # Send the results back to the handler server, answering the same request IDs
+            bytes_to_send = _answer_bytes(message.request_id, percentages_change_ai)
             sock.sendall(bytes_to_send)
 
             # Repeat
             continue
 
         else:
-            # Because message.type is FINISH we have nothing else to do but terminate
+            # Because message.type is FINISH we have nothing else to do for this handler server
             break
 
-    sock.close()
+
+def _detect(strings: List[str], detector_function: Optional[Callable[[str], float]],
+            batch_function: Optional[Callable[[List[str]], List[float]]]) -> List[Union[float, HelperError]]:
+    # The batch function is used for batches and the detector function, if given, for single texts
+    if batch_function is not None and (len(strings) > 1 or detector_function is None):
+        try:
+            percentages_change_ai = batch_function(strings)
+        except HelperError as e:
+            return [e] * len(strings)
+
+        if len(percentages_change_ai) != len(strings):
+            raise ValueError(f"The batch function returned {len(percentages_change_ai)} results for "
+                             f"{len(strings)} texts")
+
+        return percentages_change_ai
+
+    percentages_change_ai = []
+    for string in strings:
+        try:
+            percentages_change_ai.append(detector_function(string))
+        except HelperError as e:
+            percentages_change_ai.append(e)
+
+    return percentages_change_ai
+
+
+def _answer_bytes(request_ids: List[int], percentages_change_ai: List[Union[float, HelperError]]) -> bytes:
+    # The results are sent together, and each error as an ERROR message of its own
+    results = list(zip(request_ids, percentages_change_ai))
+    answered = [(request_id, percentage_change_ai) for request_id, percentage_change_ai in results
+                if not isinstance(percentage_change_ai, HelperError)]
+
+    bytes_to_send = b""
+    if len(answered) == 1:
+        bytes_to_send += AIDetectorMessages.DATA.create_message(*answered[0])
+    elif answered:
+        bytes_to_send += AIDetectorMessages.BATCH_DATA.create_message(
+            [request_id for request_id, _percentage_change_ai in answered],
+            [percentage_change_ai for _request_id, percentage_change_ai in answered]
+        )
+
+    for request_id, percentage_change_ai in results:
+        if isinstance(percentage_change_ai, HelperError):
+            bytes_to_send += AIDetectorMessages.ERROR.create_message(request_id, percentage_change_ai)
+
+    return bytes_to_send
+
+
+def _dynamic_batching_server(sock: socket.socket, frame_reader: FrameReader,
+                             detector_function: Optional[Callable[[str], float]],
+                             batch_function: Optional[Callable[[List[str]], List[float]]],
+                             max_batch_size: int, max_batch_delay: float,
+                             length_function: Callable[[str], int], bucket_width: int) -> None:
+    received = queue.Queue()
+
+    def receive_messages() -> None:
+        # Runs in its own thread, so texts keep arriving while a batch is being run
+        try:
+            while True:
+                message = frame_reader.read_message(ServerMessages)
+                received.put(message)
+                if message.type == ServerMessages.FINISH:
+                    return
+        except OSError as e:
+            # Including the socket being closed because the batch function raised an exception
+            received.put(e)
+
+    threading.Thread(target=receive_messages, daemon=True).start()
+
+    # Each bucket holds the request ID, text and arrival time of texts of similar length, oldest first
+    buckets: Dict[int, List[Tuple[int, str, float]]] = {}
+    finished = False
+
+    def add_to_buckets(item) -> bool:
+        # Returns whether the handler server has finished sending texts
+        if isinstance(item, OSError):
+            raise item
+        if item.type == ServerMessages.FINISH:
+            return True
+
+        if item.type == ServerMessages.DATA:
+            texts = [(item.request_id, item.data)]
+        else:
+            texts = list(zip(item.request_id, item.data))
+
+        arrival_time = time.monotonic()
+        for request_id, string in texts:
+            buckets.setdefault(length_function(string) // bucket_width, []).append((request_id, string, arrival_time))
+
+        return False
+
+    def run_batch(batch: List[Tuple[int, str, float]]) -> None:
+        request_ids = [request_id for request_id, _string, _arrival_time in batch]
+        strings = [string for _request_id, string, _arrival_time in batch]
+
+        # Calculate the change of each being AI generated, or get the errors saying why they could not be
+        percentages_change_ai = _detect(strings, detector_function, batch_function)
+
+        # Send the results back to the handler server, answering the same request IDs
+        bytes_to_send = _answer_bytes(request_ids, percentages_change_ai)
+        sock.sendall(bytes_to_send)
+
+    while not finished or buckets:
+        # Run the buckets that are full or have waited long enough, oldest first
+        now = time.monotonic()
+        for key in sorted(buckets, key=lambda bucket_key: buckets[bucket_key][0][2]):
+            bucket = buckets[key]
+            while bucket and (len(bucket) >= max_batch_size or finished or now - bucket[0][2] >= max_batch_delay):
+                run_batch(bucket[:max_batch_size])
+                del bucket[:max_batch_size]
+            if not bucket:
+                del buckets[key]
+
+        if finished:
+            continue
+
+        # Wait for more texts, but no longer than the oldest text has left to wait
+        if buckets:
+            oldest_arrival_time = min(bucket[0][2] for bucket in buckets.values())
+            timeout = max(0.0, oldest_arrival_time + max_batch_delay - time.monotonic())
+        else:
+            timeout = None
+
+        try:
+            finished = add_to_buckets(received.get(timeout=timeout))
+            # Take everything else already received before deciding what to run
+            while not finished and not received.empty():
+                finished = add_to_buckets(received.get_nowait())
+        except queue.Empty:
+            pass
@@ -1 +1 @@
-python main.py --load-data-file load_data.py --paraphraser-file gpt_paraphraser.py --paraphraser-conda-env gpt_env --ai-detector-file radar_detector.py --ai-detector-conda-env radar_env --timeout-when-accepting-connections 20
\ No newline at end of file
+python main.py --load-data-file load_data.py --paraphraser-file gpt_paraphraser.py --paraphraser-conda-env gpt_env --ai-detector-file radar_detector.py --ai-detector-conda-env radar_env --batch-size 8 --request-window 64
\ No newline at end of file
@@ -1,34 +1,100 @@
-import socket
 import struct
+from typing import List
 
 from .BaseMessages import BaseMessages
+from .HelperError import HelperError
 from .Message import Message
 
 
-def _DATA_read_rest_of_message_from(sock: socket.socket) -> Message:
-    percentage_as_float_bytes = bytes()
-    while len(percentage_as_float_bytes) != 4:
-        percentage_as_float_bytes += sock.recv(4 - len(percentage_as_float_bytes))
-    percentage_as_float, = struct.unpack("!f", percentage_as_float_bytes)
+def _DATA_read_from_payload(payload: memoryview) -> Message:
+    request_id, percentage_as_float = struct.unpack_from("!If", payload)
 
-    return Message(AIDetectorMessages.DATA, percentage_as_float)
+    return Message(AIDetectorMessages.DATA, percentage_as_float, request_id)
 
 
-def _DATA_create_message_with(data: float) -> bytes:
-    message_bytes = struct.pack("!Bf", AIDetectorMessages.DATA.value, data)
+def _DATA_create_message_with(request_id: int, data: float) -> bytes:
+    message_bytes = AIDetectorMessages.DATA.create_header(8) + struct.pack("!If", request_id, data)
 
     return message_bytes
 
 
+def _BATCH_DATA_read_from_payload(payload: memoryview) -> Message:
+    request_ids = []
+    percentages = []
+    for request_id, percentage_as_float in struct.iter_unpack("!If", payload[4:]):
+        request_ids.append(request_id)
+        percentages.append(percentage_as_float)
+
+    return Message(AIDetectorMessages.BATCH_DATA, percentages, request_ids)
+
+
+def _BATCH_DATA_create_message_with(request_ids: List[int], data: List[float]) -> bytes:
+    message_parts = [struct.pack("!I", len(data))]
+    for request_id, percentage in zip(request_ids, data):
+        message_parts.append(struct.pack("!If", request_id, percentage))
+    payload_bytes = b"".join(message_parts)
+
+    return AIDetectorMessages.BATCH_DATA.create_header(len(payload_bytes)) + payload_bytes
+
+
+def _READY_read_from_payload(payload: memoryview) -> Message:
+    return Message(AIDetectorMessages.READY, None)
+
+
+def _READY_create_message_with() -> bytes:
+    message_bytes = AIDetectorMessages.READY.create_header(0)
+
+    return message_bytes
+
+
+def _ERROR_read_from_payload(payload: memoryview) -> Message:
+    request_id, code_length = struct.unpack_from("!IH", payload)
+    code = str(payload[6:6 + code_length], "UTF-8")
+    text = str(payload[6 + code_length:], "UTF-8")
+
+    return Message(AIDetectorMessages.ERROR, HelperError(code, text), request_id)
+
+
+def _ERROR_create_message_with(request_id: int, error: HelperError) -> bytes:
+    code_bytes = error.code.encode("UTF-8")
+    text_bytes = error.text.encode("UTF-8")
+    payload_bytes = struct.pack("!IH", request_id, len(code_bytes)) + code_bytes + text_bytes
+
+    return AIDetectorMessages.ERROR.create_header(len(payload_bytes)) + payload_bytes
+
+
 class AIDetectorMessages(BaseMessages):
     """
     The types of messages sent by the main handler.
     This value is seen as the first byte of a message from the AI detector server as an unsigned char in network
     endianness.
+    Then four bytes as an unsigned integer for the length of the payload, everything after these first five bytes.
     """
 
-    DATA = 1, _DATA_read_rest_of_message_from, _DATA_create_message_with
+    DATA = (1, _DATA_read_from_payload, _DATA_create_message_with)
     """
     Indicates that the message contains data.
-    Following this is four bytes as a float.
+    The payload is four bytes as an unsigned integer for the request ID being answered.
+    Then four bytes as a float.
+    """
+
+    BATCH_DATA = (2, _BATCH_DATA_read_from_payload, _BATCH_DATA_create_message_with)
+    """
+    Indicates that the message contains several pieces of data.
+    The payload is four bytes as an unsigned integer for the number of pieces of data.
+    Then for each piece, four bytes as an unsigned integer for the request ID being answered and four bytes as a float.
+    """
+
+    READY = (3, _READY_read_from_payload, _READY_create_message_with)
+    """
+    Indicates that the helper is ready to be sent data, with an empty payload.
+    This is the first message the helper sends, once everything it needs, such as a model, has been loaded.
+    """
+
+    ERROR = (4, _ERROR_read_from_payload, _ERROR_create_message_with)
+    """
+    Indicates that the helper could not give a result for a request, in place of the result.
+    The payload is four bytes as an unsigned integer for the request ID being answered, two bytes as an unsigned short
+     for the length of the error code and the error code, then the rest of the payload is the error text.
+    Both are strings encoded as UTF-8, and are read as a `HelperError`.
     """
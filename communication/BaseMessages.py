@@ -1,26 +1,37 @@
-import socket
 import struct
 from enum import Enum
-from typing import Callable, TYPE_CHECKING
+from typing import Callable, Dict, TYPE_CHECKING
 
 if TYPE_CHECKING:  # Preventing an import cycle with Message for type checking
     from .Message import Message
 
+HEADER = struct.Struct("!BI")
+"""
+The header at the start of every message.
+The indicator for the message type as an unsigned char, then the length of the payload after the header as an unsigned
+ integer, both in network endianness.
+"""
+
+_members_by_indicator: Dict[type, Dict[int, "BaseMessages"]] = {}
+
 
 class BaseMessages(Enum):
     def __init__(self, value,
-                 read_rest_of_message_from: Callable[[socket.socket], "Message"],
+                 read_from_payload: Callable[[memoryview], "Message"],
                  create_message: Callable[..., bytes]):
         """
         :param value: The indicator for the message type.
-        :param read_rest_of_message_from:
-            The function that takes a socket and returns the constructed message base on the indicator.
+        :param read_from_payload:
+            The function that takes the payload of a message, everything after the header, and returns the constructed
+             message based on the indicator.
+            The payload is only valid during the call, so nothing should keep a reference to it.
         :param create_message:
-            The function that takes data necessary to create a message and returns the bytes for that message.
+            The function that takes data necessary to create a message and returns the bytes for that message,
+             including the header.
         """
 
         self._value_ = value
-        self.read_rest_of_message_from = read_rest_of_message_from
+        self.read_from_payload = read_from_payload
         self.create_message = create_message
 
     @classmethod
@@ -33,20 +44,20 @@ class BaseMessages(Enum):
         :raises ValueError: If the given integer is not found in a BaseMessageType enum.
         """
 
-        for value in cls:
-            if value.value == some_int:
-                return value
+        if cls not in _members_by_indicator:
+            _members_by_indicator[cls] = {value.value: value for value in cls}
 
-        raise ValueError(f"Unknown int for MessageTypes: {some_int}")
+        try:
+            return _members_by_indicator[cls][some_int]
+        except KeyError:
+            raise ValueError(f"Unknown int for MessageTypes: {some_int}") from None
 
-    @classmethod
-    def read_indicator_from(cls, sock: socket.socket) -> "BaseMessages":
+    def create_header(self, payload_length: int) -> bytes:
         """
-        Given a socket, read a value from a BaseMessageType enum.
-        :param sock: The socket to read.
-        :return: The BaseMessageType enum value.
+        Creates the header for a message of this type.
+
+        :param payload_length: The length of the payload that follows the header.
+        :return: The header bytes.
         """
 
-        indicator_byte = sock.recv(1)
-        indicator_int, = struct.unpack("!B", indicator_byte)
-        return cls.from_int(indicator_int)
+        return HEADER.pack(self.value, payload_length)
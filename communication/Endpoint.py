@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import os
+import socket
+import stat
+from typing import Awaitable, Callable, Tuple, Union
+
+
+class Endpoint:
+    """
+    Where a server listens, and so where to connect to it, over one of the supported transports.
+
+    Written as `host:port` for TCP, or as `unix:path` for a unix domain socket.
+    A unix domain socket only works between processes on the same machine, but skips the TCP stack entirely.
+    """
+
+    TRANSPORTS = ("tcp", "unix")
+    """The names of the supported transports."""
+
+    def __init__(self, transport: str, address: Union[Tuple[str, int], str]) -> None:
+        """
+        :param transport: The name of the transport, one of `TRANSPORTS`.
+        :param address: The host and port for TCP, or the path of the socket file for a unix domain socket.
+        :raises ValueError: If the transport is not supported.
+        """
+
+        if transport not in self.TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport!r}, expected one of {', '.join(self.TRANSPORTS)}")
+
+        self.transport: str = transport
+        """The name of the transport."""
+
+        self.address: Union[Tuple[str, int], str] = address
+        """The host and port for TCP, or the path of the socket file for a unix domain socket."""
+
+    @classmethod
+    def parse(cls, text: str) -> "Endpoint":
+        """
+        Reads an endpoint written as `host:port` or `unix:path`.
+
+        :param text: The endpoint as text.
+        :return: The endpoint.
+        :raises ValueError: If the text is not a valid endpoint.
+        """
+
+        if text.startswith("unix:"):
+            path = text[len("unix:"):]
+            if not path:
+                raise ValueError(f"Expected a path after unix:, got {text!r}")
+
+            return cls("unix", path)
+
+        host, separator, port = text.rpartition(":")
+        if not separator or not host or not port.isdigit():
+            raise ValueError(f"Expected an endpoint written as host:port or unix:path, got {text!r}")
+
+        return cls("tcp", (host, int(port)))
+
+    def __str__(self) -> str:
+        if self.transport == "unix":
+            return "unix:" + self.address
+
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def connect(self) -> socket.socket:
+        """
+        Connects to the server at this endpoint.
+
+        :return: The socket object connected to the server.
+        :raises TimeoutError: If the server cannot be reached.
+        """
+
+        family = socket.AF_UNIX if self.transport == "unix" else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(2)
+        sock.connect(self.address)
+        sock.settimeout(None)
+
+        return sock
+
+    async def async_connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        The same as `connect` but for an asyncio event loop.
+
+        :return: The reader and writer streams connected to the server.
+        :raises asyncio.TimeoutError: If the server cannot be reached.
+        """
+
+        if self.transport == "unix":
+            connecting = asyncio.open_unix_connection(self.address)
+        else:
+            connecting = asyncio.open_connection(*self.address)
+
+        return await asyncio.wait_for(connecting, 2)
+
+    def listen(self) -> socket.socket:
+        """
+        Creates a socket listening for connections at this endpoint.
+
+        :return: The listening socket.
+        """
+
+        if self.transport == "unix":
+            self._remove_stale_socket_file()
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(self.address)
+            listener.listen()
+            return listener
+
+        return socket.create_server(self.address)
+
+    async def async_listen(self, on_connection: Callable[[asyncio.StreamReader, asyncio.StreamWriter],
+                                                         Awaitable[None]]) -> Tuple[asyncio.AbstractServer, "Endpoint"]:
+        """
+        The same as `listen` but for an asyncio event loop.
+        A TCP port of 0 is given a free port by the operating system.
+
+        :param on_connection: The coroutine function called with the reader and writer of each new connection.
+        :return: The server and the endpoint it is actually listening at.
+        """
+
+        if self.transport == "unix":
+            # Bound the same way as by `listen`, as asyncio would otherwise remove the socket file of a daemon still
+            #  running there
+            server = await asyncio.start_unix_server(on_connection, sock=self.listen())
+            return server, self
+
+        server = await asyncio.start_server(on_connection, *self.address)
+        port = server.sockets[0].getsockname()[1]
+
+        return server, Endpoint("tcp", (self.address[0], port))
+
+    def _remove_stale_socket_file(self) -> None:
+        # A daemon that was killed leaves its socket file behind, which would stop anything listening here again
+        # Only a socket nothing is accepting connections on is removed, so a daemon still running is left alone
+        try:
+            if not stat.S_ISSOCK(os.stat(self.address).st_mode):
+                return
+        except FileNotFoundError:
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.address)
+            except ConnectionRefusedError:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.address)
@@ -0,0 +1,111 @@
+import asyncio
+import socket
+from typing import Type, Union
+
+from .BaseMessages import BaseMessages, HEADER
+from .Message import Message
+
+
+class FrameReader:
+    """
+    Reads messages from a connection through one reusable buffer.
+
+    Received bytes go straight into the buffer, with as many bytes as are available taken at once, so several small
+     messages can arrive in one call and a large message is never built up piece by piece.
+    Each message is then read from a view of its payload in the buffer, without copying it out first.
+
+    Messages can be read from a socket with `read_message` or from an asyncio stream with `async_read_message`.
+    """
+
+    def __init__(self, source: Union[socket.socket, asyncio.StreamReader], initial_buffer_size: int = 64 * 1024) \
+            -> None:
+        """
+        :param source: The socket or asyncio stream to read from.
+        :param initial_buffer_size: The starting size of the buffer, which grows to fit larger messages.
+        """
+
+        self.source: Union[socket.socket, asyncio.StreamReader] = source
+        """The socket or asyncio stream to read from."""
+
+        self._buffer: bytearray = bytearray(initial_buffer_size)
+        # The unread bytes in the buffer are from _start up to _end
+        self._start: int = 0
+        self._end: int = 0
+
+    def read_message(self, messages: Type[BaseMessages]) -> Message:
+        """
+        Waits for the next message from the socket.
+
+        :param messages: The message types that can be received.
+        :return: The message.
+        :raises ConnectionError: If the connection is closed before the full message is received.
+        """
+
+        self._fill(HEADER.size)
+        message_type, payload_length = self._read_header(messages)
+        self._fill(HEADER.size + payload_length)
+
+        return self._read_payload(message_type, payload_length)
+
+    async def async_read_message(self, messages: Type[BaseMessages]) -> Message:
+        """
+        The same as `read_message` but for an asyncio stream.
+        """
+
+        await self._async_fill(HEADER.size)
+        message_type, payload_length = self._read_header(messages)
+        await self._async_fill(HEADER.size + payload_length)
+
+        return self._read_payload(message_type, payload_length)
+
+    def _read_header(self, messages: Type[BaseMessages]):
+        indicator, payload_length = HEADER.unpack_from(self._buffer, self._start)
+
+        return messages.from_int(indicator), payload_length
+
+    def _read_payload(self, message_type: BaseMessages, payload_length: int) -> Message:
+        payload_start = self._start + HEADER.size
+        payload_end = payload_start + payload_length
+
+        # The views are released before the buffer can be resized
+        with memoryview(self._buffer) as buffer_view, buffer_view[payload_start:payload_end] as payload:
+            message = message_type.read_from_payload(payload)
+        self._start = payload_end
+
+        return message
+
+    def _make_room_for(self, length: int) -> None:
+        # Makes sure `length` bytes from the start of the unread bytes fit in the buffer
+        if self._start + length <= len(self._buffer):
+            return
+
+        unread = self._end - self._start
+        if length > len(self._buffer):
+            new_buffer = bytearray(max(length, 2 * len(self._buffer)))
+            new_buffer[:unread] = self._buffer[self._start:self._end]
+            self._buffer = new_buffer
+        else:
+            # Moving the unread bytes to the front of the buffer
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = unread
+
+    def _fill(self, length: int) -> None:
+        # Waits until there are at least `length` unread bytes
+        self._make_room_for(length)
+        while self._end - self._start < length:
+            with memoryview(self._buffer) as buffer_view, buffer_view[self._end:] as free_space:
+                received = self.source.recv_into(free_space)
+            if received == 0:
+                raise ConnectionError("The connection was closed before the full message was received")
+            self._end += received
+
+    async def _async_fill(self, length: int) -> None:
+        # The same as _fill but for an asyncio stream, which keeps its own buffer to copy from
+        self._make_room_for(length)
+        while self._end - self._start < length:
+            received_bytes = await self.source.read(len(self._buffer) - self._end)
+            if not received_bytes:
+                raise ConnectionError("The connection was closed before the full message was received")
+            self._buffer[self._end:self._end + len(received_bytes)] = received_bytes
+            self._end += len(received_bytes)
@@ -0,0 +1,23 @@
+class HelperError(Exception):
+    """
+    A request a helper could not give a result for, such as a text rejected by a web API, with an error code and text
+     saying why.
+
+    Raised by a helper's function for a text it cannot handle, and sent to the handler server as an ERROR message in
+     place of the result, so the helper keeps going rather than crashing.
+    The handler server raises it again for the request, so it can record why the result is missing.
+    """
+
+    def __init__(self, code: str, text: str = "") -> None:
+        """
+        :param code: A short code for the kind of error, such as `bad_request`.
+        :param text: A description of the error.
+        """
+
+        super().__init__(f"{code}: {text}" if text else code)
+
+        self.code: str = code
+        """A short code for the kind of error."""
+
+        self.text: str = text
+        """A description of the error."""
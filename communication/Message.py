@@ -1,15 +1,25 @@
-from typing import Any
+from typing import Any, List, Union
 
 from .BaseMessages import BaseMessages
 
 
 class Message:
-    def __init__(self, type_: BaseMessages, data: Any) -> None:
+    def __init__(self, type_: BaseMessages, data: Any, request_id: Union[int, List[int], None] = None) -> None:
         self.type: BaseMessages = type_
         """The type of the message."""
 
         self.data: Any = data
         """Any data required for the message."""
 
+        self.request_id: Union[int, List[int], None] = request_id
+        """
+        The ID of the request the message belongs to, if the message is part of a request.
+        For batch messages this is a list of request IDs in the same order as the data.
+        """
+
     def __str__(self) -> str:
-        return "Message(type=" + self.type.name + ", data='" + str(self.data) + "')"
+        if self.request_id is None:
+            return "Message(type=" + self.type.name + ", data='" + str(self.data) + "')"
+
+        return ("Message(type=" + self.type.name + ", request_id=" + str(self.request_id) +
+                ", data='" + str(self.data) + "')")
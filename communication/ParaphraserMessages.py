@@ -1,38 +1,115 @@
-import socket
 import struct
+from typing import List
 
-from communication.BaseMessages import BaseMessages
+from .BaseMessages import BaseMessages
+from .HelperError import HelperError
 from .Message import Message
-from .read_length_then_data_from import read_length_then_data_from
 
 
-def _DATA_read_rest_of_message_from(sock: socket.socket) -> Message:
-    data_bytes = read_length_then_data_from(sock)
+def _DATA_read_from_payload(payload: memoryview) -> Message:
+    request_id, = struct.unpack_from("!I", payload)
+    string = str(payload[4:], "UTF-8")
 
-    string = data_bytes.decode("UTF-8")
+    return Message(ParaphraserMessages.DATA, string, request_id)
 
-    return Message(ParaphraserMessages.DATA, string)
 
-
-def _DATA_create_message_with(data: str) -> bytes:
+def _DATA_create_message_with(request_id: int, data: str) -> bytes:
     data_bytes = data.encode("UTF-8")
-    header_bytes = struct.pack("!BI", ParaphraserMessages.DATA.value, len(data_bytes))
+    header_bytes = ParaphraserMessages.DATA.create_header(4 + len(data_bytes)) + struct.pack("!I", request_id)
     message_bytes = header_bytes + data_bytes
 
     return message_bytes
 
 
+def _BATCH_DATA_read_from_payload(payload: memoryview) -> Message:
+    count, = struct.unpack_from("!I", payload)
+
+    request_ids = []
+    strings = []
+    offset = 4
+    for _ in range(count):
+        request_id, length = struct.unpack_from("!II", payload, offset)
+        offset += 8
+
+        request_ids.append(request_id)
+        strings.append(str(payload[offset:offset + length], "UTF-8"))
+        offset += length
+
+    return Message(ParaphraserMessages.BATCH_DATA, strings, request_ids)
+
+
+def _BATCH_DATA_create_message_with(request_ids: List[int], data: List[str]) -> bytes:
+    message_parts = [struct.pack("!I", len(data))]
+    for request_id, string in zip(request_ids, data):
+        data_bytes = string.encode("UTF-8")
+        message_parts.append(struct.pack("!II", request_id, len(data_bytes)))
+        message_parts.append(data_bytes)
+    payload_bytes = b"".join(message_parts)
+
+    return ParaphraserMessages.BATCH_DATA.create_header(len(payload_bytes)) + payload_bytes
+
+
+def _READY_read_from_payload(payload: memoryview) -> Message:
+    return Message(ParaphraserMessages.READY, None)
+
+
+def _READY_create_message_with() -> bytes:
+    message_bytes = ParaphraserMessages.READY.create_header(0)
+
+    return message_bytes
+
+
+def _ERROR_read_from_payload(payload: memoryview) -> Message:
+    request_id, code_length = struct.unpack_from("!IH", payload)
+    code = str(payload[6:6 + code_length], "UTF-8")
+    text = str(payload[6 + code_length:], "UTF-8")
+
+    return Message(ParaphraserMessages.ERROR, HelperError(code, text), request_id)
+
+
+def _ERROR_create_message_with(request_id: int, error: HelperError) -> bytes:
+    code_bytes = error.code.encode("UTF-8")
+    text_bytes = error.text.encode("UTF-8")
+    payload_bytes = struct.pack("!IH", request_id, len(code_bytes)) + code_bytes + text_bytes
+
+    return ParaphraserMessages.ERROR.create_header(len(payload_bytes)) + payload_bytes
+
+
 class ParaphraserMessages(BaseMessages):
     """
     The types of messages sent by the main handler.
     This value is seen as the first byte of a message from the paraphraser server as an unsigned char in network
     endianness.
+    Then four bytes as an unsigned integer for the length of the payload, everything after these first five bytes.
     """
 
-    DATA = 1, _DATA_read_rest_of_message_from, _DATA_create_message_with
+    DATA = (1, _DATA_read_from_payload, _DATA_create_message_with)
     """
     Indicates that the message contains data.
-    Following this is four bytes as an unsigned integer for the length of the data.
-    Then the data, which is a string encoded as UTF-8.
+    The payload is four bytes as an unsigned integer for the request ID being answered.
+    Then the rest of the payload is the data, which is a string encoded as UTF-8.
     The same as what the server sends to the paraphraser.
     """
+
+    BATCH_DATA = (2, _BATCH_DATA_read_from_payload, _BATCH_DATA_create_message_with)
+    """
+    Indicates that the message contains several pieces of data.
+    The payload is four bytes as an unsigned integer for the number of pieces of data.
+    Then for each piece, four bytes as an unsigned integer for the request ID being answered, four bytes as an unsigned
+     integer for the length of the data and the data, which is a string encoded as UTF-8.
+    The same as what the server sends to the paraphraser.
+    """
+
+    READY = (3, _READY_read_from_payload, _READY_create_message_with)
+    """
+    Indicates that the helper is ready to be sent data, with an empty payload.
+    This is the first message the helper sends, once everything it needs, such as a model, has been loaded.
+    """
+
+    ERROR = (4, _ERROR_read_from_payload, _ERROR_create_message_with)
+    """
+    Indicates that the helper could not give a result for a request, in place of the result.
+    The payload is four bytes as an unsigned integer for the request ID being answered, two bytes as an unsigned short
+     for the length of the error code and the error code, then the rest of the payload is the error text.
+    Both are strings encoded as UTF-8, and are read as a `HelperError`.
+    """
@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+from typing import Any, Dict, List, Tuple, Type
+
+from .BaseMessages import BaseMessages
+from .FrameReader import FrameReader
+from .HelperError import HelperError
+from .ServerMessages import ServerMessages
+
+
+class RequestWindow:
+    """
+    Keeps track of the requests sent to a helper over an asyncio stream that have not been answered yet.
+
+    Up to `window_size` requests can be in flight at once, so the helper always has its next piece of work waiting in
+     the socket instead of waiting on a round trip to the handler server.
+    Each request is given a request ID and a future, and responses are matched to their requests by request ID, so they
+     can arrive in any order.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 response_messages: Type[BaseMessages], window_size: int) -> None:
+        """
+        :param reader: The stream to read responses from the helper.
+        :param writer: The stream to write requests to the helper.
+        :param response_messages: The message types the helper responds with.
+        :param window_size: The maximum number of requests in flight at once.
+        :raises ValueError: If the window size is less than one.
+        """
+
+        if window_size < 1:
+            raise ValueError(f"The window size must be at least 1, got {window_size}")
+
+        self.reader: asyncio.StreamReader = reader
+        """The stream to read responses from the helper."""
+
+        self.writer: asyncio.StreamWriter = writer
+        """The stream to write requests to the helper."""
+
+        self.response_messages: Type[BaseMessages] = response_messages
+        """The message types the helper responds with."""
+
+        self.window_size: int = window_size
+        """The maximum number of requests in flight at once."""
+
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        """The futures of the requests that have been sent but not answered, by request ID."""
+
+        self._in_flight_strings: Dict[int, str] = {}
+        self._frame_reader: FrameReader = FrameReader(reader)
+        self._next_request_id: int = 0
+        self._room_changed: asyncio.Condition = asyncio.Condition()
+
+    def has_room_for(self, count: int) -> bool:
+        """
+        Whether `count` more requests can be sent without going over the window size.
+        An empty window always has room, so a batch larger than the window can still be sent on its own.
+        """
+
+        return not self.in_flight or len(self.in_flight) + count <= self.window_size
+
+    def is_empty(self) -> bool:
+        return not self.in_flight
+
+    async def wait_for_room(self, count: int) -> None:
+        """
+        Waits until `count` more requests can be sent.
+        """
+
+        async with self._room_changed:
+            await self._room_changed.wait_for(lambda: self.has_room_for(count))
+
+    async def wait_until_ready(self) -> None:
+        """
+        Waits for the helper to say it is ready, which must come before any requests are sent.
+
+        :raises ValueError: If the first message from the helper is not a READY message.
+        :raises ConnectionError: If the helper closes the connection.
+        """
+
+        message = await self._frame_reader.async_read_message(self.response_messages)
+
+        if message.type != self.response_messages.READY:
+            raise ValueError(f"Expected a READY message from the helper, got {message}")
+
+    async def send(self, requests: List[Tuple[str, asyncio.Future]]) -> None:
+        """
+        Sends requests to the helper.
+        A single request is sent as a DATA message and several as one BATCH_DATA message.
+
+        :param requests: The strings to send and the futures to set with their results.
+        """
+
+        request_ids = []
+        for string, future in requests:
+            request_ids.append(self._next_request_id)
+            self.in_flight[self._next_request_id] = future
+            self._in_flight_strings[self._next_request_id] = string
+            self._next_request_id = (self._next_request_id + 1) % 2 ** 32
+
+        strings = [string for string, _future in requests]
+        if len(requests) == 1:
+            bytes_to_send = ServerMessages.DATA.create_message(request_ids[0], strings[0])
+        else:
+            bytes_to_send = ServerMessages.BATCH_DATA.create_message(request_ids, strings)
+        self.writer.write(bytes_to_send)
+        await self.writer.drain()
+
+    async def receive(self) -> None:
+        """
+        Waits for the next response from the helper and sets the futures of the requests it answers.
+        An ERROR response sets its request's future with the `HelperError` instead.
+
+        :raises ValueError: If the response is for a request that is not in flight.
+        :raises ConnectionError: If the helper closes the connection.
+        """
+
+        message = await self._frame_reader.async_read_message(self.response_messages)
+
+        if isinstance(message.request_id, list):
+            results: List[Tuple[int, Any]] = list(zip(message.request_id, message.data))
+        else:
+            results = [(message.request_id, message.data)]
+
+        for request_id, result in results:
+            if request_id not in self.in_flight:
+                raise ValueError(f"Received a response for unknown request ID {request_id}")
+
+            future = self.in_flight.pop(request_id)
+            del self._in_flight_strings[request_id]
+            # The future may have been cancelled by whoever was waiting on it
+            if not future.done():
+                if isinstance(result, HelperError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+        async with self._room_changed:
+            self._room_changed.notify_all()
+
+    def fail(self, exception: BaseException) -> None:
+        """
+        Sets the exception on the futures of every request in flight, for when the helper can no longer answer them.
+        """
+
+        for future in self.in_flight.values():
+            if not future.done():
+                future.set_exception(exception)
+        self.in_flight.clear()
+        self._in_flight_strings.clear()
+
+    def front(self, count: int) -> List[Tuple[str, asyncio.Future]]:
+        """
+        The requests that have been in flight longest, which the helper is working on or will be next, as it answers
+         them in the order they were sent.
+
+        :param count: The number of requests to give.
+        :return: The strings sent and the futures to set with their results, in the order they were sent.
+        """
+
+        request_ids = itertools.islice(self.in_flight, count)
+        return [(self._in_flight_strings[request_id], self.in_flight[request_id]) for request_id in request_ids]
+
+    def take_unanswered(self) -> List[Tuple[str, asyncio.Future]]:
+        """
+        Takes every request in flight out of the window, for when the helper can no longer answer them but another
+         helper can.
+
+        :return: The strings sent and the futures to set with their results, in the order they were sent.
+        """
+
+        unanswered = [(self._in_flight_strings[request_id], future) for request_id, future in self.in_flight.items()]
+        self.in_flight.clear()
+        self._in_flight_strings.clear()
+
+        return unanswered
@@ -1,33 +1,59 @@
-import socket
 import struct
+from typing import List
 
 from .BaseMessages import BaseMessages
 from .Message import Message
-from .read_length_then_data_from import read_length_then_data_from
 
 
-def _DATA_read_rest_of_message_from(sock: socket.socket) -> Message:
-    data_bytes = read_length_then_data_from(sock)
+def _DATA_read_from_payload(payload: memoryview) -> Message:
+    request_id, = struct.unpack_from("!I", payload)
+    string = str(payload[4:], "UTF-8")
 
-    string = data_bytes.decode("UTF-8")
+    return Message(ServerMessages.DATA, string, request_id)
 
-    return Message(ServerMessages.DATA, string)
 
-
-def _DATA_create_message_with(data: str) -> bytes:
+def _DATA_create_message_with(request_id: int, data: str) -> bytes:
     data_bytes = data.encode("UTF-8")
-    header_bytes = struct.pack("!BI", ServerMessages.DATA.value, len(data_bytes))
+    header_bytes = ServerMessages.DATA.create_header(4 + len(data_bytes)) + struct.pack("!I", request_id)
     message_bytes = header_bytes + data_bytes
 
     return message_bytes
 
 
-def _FINISH_read_rest_of_message_from(sock: socket.socket) -> Message:
+def _BATCH_DATA_read_from_payload(payload: memoryview) -> Message:
+    count, = struct.unpack_from("!I", payload)
+
+    request_ids = []
+    strings = []
+    offset = 4
+    for _ in range(count):
+        request_id, length = struct.unpack_from("!II", payload, offset)
+        offset += 8
+
+        request_ids.append(request_id)
+        strings.append(str(payload[offset:offset + length], "UTF-8"))
+        offset += length
+
+    return Message(ServerMessages.BATCH_DATA, strings, request_ids)
+
+
+def _BATCH_DATA_create_message_with(request_ids: List[int], data: List[str]) -> bytes:
+    message_parts = [struct.pack("!I", len(data))]
+    for request_id, string in zip(request_ids, data):
+        data_bytes = string.encode("UTF-8")
+        message_parts.append(struct.pack("!II", request_id, len(data_bytes)))
+        message_parts.append(data_bytes)
+    payload_bytes = b"".join(message_parts)
+
+    return ServerMessages.BATCH_DATA.create_header(len(payload_bytes)) + payload_bytes
+
+
+def _FINISH_read_from_payload(payload: memoryview) -> Message:
     return Message(ServerMessages.FINISH, None)
 
 
 def _FINISH_create_message_with() -> bytes:
-    message_bytes = struct.pack("!B", ServerMessages.FINISH.value)
+    message_bytes = ServerMessages.FINISH.create_header(0)
 
     return message_bytes
 
@@ -36,14 +62,26 @@ class ServerMessages(BaseMessages):
     """
     The types of messages sent by the main handler.
     This value is seen as the first byte of a message from the handler server as an unsigned char in network endianness.
+    Then four bytes as an unsigned integer for the length of the payload, everything after these first five bytes.
     """
 
-    DATA = 1, _DATA_read_rest_of_message_from, _DATA_create_message_with
+    DATA = (1, _DATA_read_from_payload, _DATA_create_message_with)
     """
     Indicates that the message contains data.
-    Following this is four bytes as an unsigned integer for the length of the data.
-    Then the data, which is a string encoded as UTF-8.
+    The payload is four bytes as an unsigned integer for the request ID.
+    Then the rest of the payload is the data, which is a string encoded as UTF-8.
+    The helper must answer with the same request ID, but answers may arrive in any order.
     """
 
-    FINISH = 2, _FINISH_read_rest_of_message_from, _FINISH_create_message_with
-    """Indicates that this process should be terminated."""
+    FINISH = (2, _FINISH_read_from_payload, _FINISH_create_message_with)
+    """Indicates that this process should be terminated, with an empty payload."""
+
+    BATCH_DATA = (3, _BATCH_DATA_read_from_payload, _BATCH_DATA_create_message_with)
+    """
+    Indicates that the message contains several pieces of data to be handled together.
+    The payload is four bytes as an unsigned integer for the number of pieces of data.
+    Then for each piece, four bytes as an unsigned integer for its request ID, four bytes as an unsigned integer for
+     the length of the data and the data, which is a string encoded as UTF-8.
+    The helper must answer every request ID, usually with a BATCH_DATA message holding the same request IDs in the same
+     order, though it may also regroup them into different messages.
+    """
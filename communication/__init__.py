@@ -1,7 +1,13 @@
 from .AIDetectorMessages import AIDetectorMessages
 from .BaseMessages import BaseMessages
+from .Endpoint import Endpoint
+from .FrameReader import FrameReader
+from .HelperError import HelperError
 from .Message import Message
 from .ParaphraserMessages import ParaphraserMessages
+from .RequestWindow import RequestWindow
 from .ServerMessages import ServerMessages
+from .address_from_argv import address_from_argv
+from .async_connect_to_server import async_connect_to_server
 from .connect_to_server import connect_to_server
-from .read_length_then_data_from import read_length_then_data_from
+from .serve_handlers_at import async_serve_handlers_at, serve_handlers_at
@@ -0,0 +1,23 @@
+import sys
+from typing import Optional
+
+
+def address_from_argv(option: str) -> Optional[str]:
+    """
+    A helper function for the helpers.
+    Finds the address given after an option on the command line, such as when a helper file is run with
+     `python radar_detector.py --listen localhost:9001`.
+
+    :param option: The option the address follows, such as `--listen`.
+    :return: The address, or None if the option was not given.
+    :raises ValueError: If the option is not followed by an address.
+    """
+
+    if option not in sys.argv:
+        return None
+
+    index = sys.argv.index(option) + 1
+    if index >= len(sys.argv):
+        raise ValueError(f"Expected an address after {option}")
+
+    return sys.argv[index]
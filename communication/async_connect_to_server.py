@@ -0,0 +1,21 @@
+import asyncio
+from typing import Tuple
+
+
+async def async_connect_to_server(server_address: str = "localhost", server_port: int = 8080) \
+        -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    The same as `connect_to_server` but for helpers running an asyncio event loop.
+    Attempts to connect to the handler server and return the streams for the connection.
+
+    :param server_address: The address of the handler server to connect to.
+    :param server_port: The port of the handler server to connect to.
+    :return: The reader and writer streams connected to the server.
+    :raises asyncio.TimeoutError: If the handler server cannot be reached.
+    """
+
+    # Attempt a connection to the server
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(server_address, server_port), 2)
+
+    # All done
+    return reader, writer
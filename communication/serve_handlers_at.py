@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import os
+import signal
+import socket
+import threading
+import traceback
+from typing import Awaitable, Callable
+
+from .Endpoint import Endpoint
+
+
+def serve_handlers_at(listen_address: str, serve_handler: Callable[[socket.socket], None]) -> None:
+    """
+    A helper function for helpers running as daemons.
+    Listens for handler servers to connect and serves them one at a time, until the process is stopped.
+    Whatever the helper loaded before this, such as a model, is kept between handler servers.
+
+    A handler server whose connection fails, or whose work raises an exception, is dropped and the next one is waited
+     for.
+
+    :param listen_address: The endpoint to listen on, written as `host:port` or `unix:path`.
+    :param serve_handler: The function that serves a connected handler server until it is done with the helper.
+    """
+
+    endpoint = Endpoint.parse(listen_address)
+    listener = endpoint.listen()
+    print(f"Listening for handler servers on {listen_address}")
+
+    # Being stopped exits through the clean up below, rather than leaving the socket file behind
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+
+    try:
+        while True:
+            sock, _peer_address = listener.accept()
+            print("Serving a handler server")
+            try:
+                serve_handler(sock)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                sock.close()
+            print("Finished with the handler server")
+    finally:
+        listener.close()
+        _remove_socket_file(endpoint)
+
+
+async def async_serve_handlers_at(listen_address: str,
+                                  serve_handler: Callable[[asyncio.StreamReader, asyncio.StreamWriter],
+                                                          Awaitable[None]]) -> None:
+    """
+    The same as `serve_handlers_at` but for helpers running an asyncio event loop.
+    Handler servers are served at the same time rather than one at a time.
+    """
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        print("Serving a handler server")
+        try:
+            await serve_handler(reader, writer)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            writer.close()
+        print("Finished with the handler server")
+
+    endpoint = Endpoint.parse(listen_address)
+    server, _endpoint = await endpoint.async_listen(on_connection)
+    print(f"Listening for handler servers on {listen_address}")
+
+    # Being stopped cancels serving, so the clean up below still happens
+    serving_task = asyncio.current_task()
+    stopped = []
+
+    def stop() -> None:
+        stopped.append(True)
+        serving_task.cancel()
+
+    with contextlib.suppress(NotImplementedError, RuntimeError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        if stopped:
+            raise SystemExit(128 + signal.SIGTERM)
+        raise
+    finally:
+        _remove_socket_file(endpoint)
+
+
+def _exit_on_signal(signum: int, _frame) -> None:
+    raise SystemExit(128 + signum)
+
+
+def _remove_socket_file(endpoint: Endpoint) -> None:
+    # A unix domain socket file is left behind otherwise, stopping the daemon from listening there again
+    if endpoint.transport == "unix":
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(endpoint.address)
@@ -0,0 +1,482 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from communication import HelperError, RequestWindow, ServerMessages
+
+
+class HelperCrashError(Exception):
+    """Raised for a request that was in flight with too many helpers when they crashed, so is given up on."""
+
+
+class HelperPool:
+    """
+    A pool of helpers of the same kind, all driven from the one event loop.
+    Each request goes to whichever helper has room for it first.
+
+    If deduplicating, a string is only sent to the helpers once and every request for it shares the one result.
+    If not remembering results, only requests for a string already waiting on the helpers share its result, so the
+     pool does not hold on to every string it has been given.
+
+    If given a deadline, a request still unanswered that long after it was sent is hedged, with a copy sent to a
+     helper that has nothing else to do.
+    A request waiting in a helper's window behind a batch's worth of others is not being worked on yet, so its deadline
+     only starts once it is among the first `batch_size` requests in the window.
+    Whichever answer arrives first is kept and the other is thrown away.
+    A helper only counts as having nothing to do once no requests are waiting to be sent, so hedging only takes up
+     helpers that would otherwise sit idle, such as while waiting on the slowest few requests at the end of a run.
+
+    If a helper crashes, the requests it had not answered go back in the queue for the other helpers, or for the helper
+     once it has been restarted by whatever is watching over the pool.
+    Every request in flight with a helper when it crashed counts the crash against it, and a request that has been in
+     flight for `max_crashes` crashes is given up on, so one input that crashes its helper cannot stop the run.
+    An in-process helper that raises an exception is treated the same way.
+    """
+
+    def __init__(self, batch_size: int, deduplicate: bool = True, remember_results: bool = True,
+                 deadline: Optional[float] = None, max_crashes: int = 3) -> None:
+        """
+        :param batch_size: The maximum number of requests to send to a helper in one message.
+        :param deduplicate: Whether requests for a string already sent share its result.
+        :param remember_results: Whether results are kept to share with later requests once they have arrived.
+        :param deadline:
+            The number of seconds a request can go unanswered before a copy is sent to an idle helper, or None to
+             never send copies.
+        :param max_crashes: The number of helper crashes a request can be in flight for before it is given up on.
+        """
+
+        self.batch_size: int = batch_size
+        """The maximum number of requests to send to a helper in one message."""
+
+        self.deduplicate: bool = deduplicate
+        """Whether requests for a string already sent share its result."""
+
+        self.remember_results: bool = remember_results
+        """Whether results are kept to share with later requests once they have arrived."""
+
+        self.duplicate_requests: int = 0
+        """The number of requests that shared the result of an earlier request instead of being sent."""
+
+        self.deadline: Optional[float] = deadline
+        """The number of seconds a request can go unanswered before a copy is sent to an idle helper, or None."""
+
+        self.requests_sent: int = 0
+        """The number of requests sent to the helpers, not counting copies."""
+
+        self.past_deadline: int = 0
+        """The number of requests still unanswered at the deadline."""
+
+        self.hedged: int = 0
+        """The number of copies sent to idle helpers."""
+
+        self.hedges_won: int = 0
+        """The number of copies answered before the request they were a copy of."""
+
+        self.max_crashes: int = max_crashes
+        """The number of helper crashes a request can be in flight for before it is given up on."""
+
+        self.crashes: int = 0
+        """The number of times a helper crashed or lost its connection while it had requests in flight."""
+
+        self.requeued: int = 0
+        """The number of requests put back in the queue after their helper crashed."""
+
+        self.given_up: int = 0
+        """The number of requests given up on after being in flight for too many crashes."""
+
+        self.windows: List[RequestWindow] = []
+        """The request windows of the helpers in the pool."""
+
+        self.lost_windows: asyncio.Queue = asyncio.Queue()
+        """The request windows of the helpers that lost their connection, for whatever is watching over the pool."""
+
+        self._requests: asyncio.Queue = asyncio.Queue()
+        self._results_by_string: Dict[str, asyncio.Future] = {}
+        self._send_tasks: List[asyncio.Task] = []
+        self._receive_tasks: List[asyncio.Task] = []
+
+        # The requests past the deadline waiting for an idle helper, with the window they were sent to if any
+        self._overdue: List[Tuple[str, asyncio.Future, Optional[RequestWindow]]] = []
+        self._hedge_tasks: Set[asyncio.Task] = set()
+        self._in_process_run_batch: Optional[Callable[[List[str]], Awaitable[List[Any]]]] = None
+        self._idle_in_process: int = 0
+        self._in_process_hedges: int = 0
+
+        # The requests waiting in a helper's window whose deadline has not started yet
+        self._deadline_not_started: Set[asyncio.Future] = set()
+        self._copies: Set[asyncio.Future] = set()
+        self._crashes_by_request: Dict[asyncio.Future, int] = {}
+        self._supervisor_tasks: List[asyncio.Task] = []
+        self._closing: bool = False
+        self._failure: Optional[BaseException] = None
+
+    def add_helper(self, window: RequestWindow) -> None:
+        """
+        Adds a helper to the pool, which starts taking requests straight away.
+
+        :param window: The request window of the helper.
+        """
+
+        send_task = asyncio.create_task(self._send_to(window))
+
+        self.windows.append(window)
+        self._send_tasks.append(send_task)
+        self._receive_tasks.append(asyncio.create_task(self._receive_from(window, send_task)))
+
+    def add_in_process_helper(self, run_batch: Callable[[List[str]], Awaitable[List[Any]]]) -> None:
+        """
+        Adds a helper running inside this process to the pool, which starts taking requests straight away.
+        It is given batches the same way as a helper with a connection, but without any messages.
+
+        :param run_batch: The coroutine function that takes a batch of strings and returns their results in order.
+        """
+
+        self._in_process_run_batch = run_batch
+        self._send_tasks.append(asyncio.create_task(self._run_in_process(run_batch)))
+
+    async def request(self, string: str) -> Any:
+        """
+        Sends a string to a helper in the pool and waits for the result.
+
+        :param string: The string to send.
+        :return: The result from the helper.
+        :raises HelperError: If the helper could not give a result for the string, saying why.
+        :raises HelperCrashError: If the request was in flight for too many helper crashes.
+        :raises ConnectionError: If the helper closes the connection before answering while the pool is closing.
+        :raises Exception: The exception the pool was failed with, if it has been.
+        """
+
+        if self._failure is not None:
+            raise self._failure
+
+        if not self.deduplicate:
+            future = asyncio.get_running_loop().create_future()
+            await self._requests.put((string, future))
+
+            return await future
+
+        # Only the exact same string shares a result, as a helper can give a different result for any change to it
+        if string in self._results_by_string:
+            self.duplicate_requests += 1
+            future = self._results_by_string[string]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._results_by_string[string] = future
+            # A failed request is not shared, so it can be tried again
+            future.add_done_callback(lambda done_future: self._forget_if_done_with(string, done_future))
+            await self._requests.put((string, future))
+
+        # Shielded so one request being cancelled does not cancel the result shared with the others
+        return await asyncio.shield(future)
+
+    def watch(self, supervisor: Awaitable[None]) -> None:
+        """
+        Runs a coroutine watching over the helpers, such as one restarting any that crash, until the pool is closed.
+
+        :param supervisor: The coroutine, which is cancelled when the pool is closed.
+        """
+
+        self._supervisor_tasks.append(asyncio.create_task(supervisor))
+
+    def fail(self, exception: BaseException) -> None:
+        """
+        Fails every request waiting to be sent and every request made from now on, for when there are no helpers left
+         to answer them.
+
+        :param exception: The exception to fail the requests with.
+        """
+
+        self._failure = exception
+        while not self._requests.empty():
+            _string, future = self._requests.get_nowait()
+            if not future.done():
+                future.set_exception(exception)
+
+    async def close(self) -> None:
+        """
+        Tells every helper in the pool to finish and waits for them to close their connections.
+        Should only be called once every request has been answered.
+        """
+
+        # A helper exiting from here on has been told to
+        self._closing = True
+        for task in self._supervisor_tasks:
+            task.cancel()
+        await asyncio.gather(*self._supervisor_tasks, return_exceptions=True)
+
+        for task in [*self._send_tasks, *self._hedge_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._send_tasks, *self._hedge_tasks, return_exceptions=True)
+
+        bytes_to_send = ServerMessages.FINISH.create_message()
+        for window in self.windows:
+            window.writer.write(bytes_to_send)
+            await window.writer.drain()
+
+        # Each helper closes its connection once it has finished
+        await asyncio.gather(*self._receive_tasks)
+
+        for window in self.windows:
+            window.writer.close()
+
+    def _requeue_after_crash(self, string: str, future: asyncio.Future, exception: BaseException) -> None:
+        if future.done():
+            return
+
+        # A copy is not worth sending again, as the request it was a copy of is still waiting elsewhere
+        if future in self._copies:
+            future.cancel()
+            return
+
+        crashes = self._crashes_by_request.get(future, 0) + 1
+        if crashes >= self.max_crashes:
+            self.given_up += 1
+            crash_error = HelperCrashError(f"Gave up on a request after {crashes} helper crash(es) while it was in "
+                                           f"flight")
+            crash_error.__cause__ = exception
+            future.set_exception(crash_error)
+            return
+
+        if crashes == 1:
+            future.add_done_callback(lambda done_future: self._crashes_by_request.pop(done_future, None))
+        self._crashes_by_request[future] = crashes
+        self.requeued += 1
+        self._requests.put_nowait((string, future))
+
+    def _lose_helper(self, window: RequestWindow, exception: BaseException) -> None:
+        self.windows.remove(window)
+        window.writer.close()
+
+        unanswered = window.take_unanswered()
+        if unanswered:
+            self.crashes += 1
+
+        for string, future in unanswered:
+            self._requeue_after_crash(string, future, exception)
+
+        self.lost_windows.put_nowait(window)
+
+    def hedging_stats(self) -> Dict[str, Any]:
+        """
+        :return: How often requests went past the deadline and were hedged.
+        """
+
+        return {
+            "deadline": self.deadline,
+            "requests_sent": self.requests_sent,
+            "past_deadline": self.past_deadline,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won
+        }
+
+    def _forget_if_done_with(self, string: str, future: asyncio.Future) -> None:
+        if not self.remember_results or future.cancelled() or future.exception() is not None:
+            if self._results_by_string.get(string) is future:
+                del self._results_by_string[string]
+
+    async def _take_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        # Wait for one request, then take as many more as are already waiting to fill the batch
+        batch = [await self._requests.get()]
+        while len(batch) < self.batch_size and not self._requests.empty():
+            batch.append(self._requests.get_nowait())
+
+        return batch
+
+    def _start_deadlines(self, batch: List[Tuple[str, asyncio.Future]], window: Optional[RequestWindow]) -> None:
+        self.requests_sent += len(batch)
+        if self.deadline is None:
+            return
+
+        # An in-process helper runs the batch straight away, while a helper with a window gets to it in its turn
+        if window is None:
+            for string, future in batch:
+                self._start_deadline(string, future, None)
+            return
+
+        for string, future in batch:
+            self._deadline_not_started.add(future)
+            future.add_done_callback(self._deadline_not_started.discard)
+
+    def _start_front_deadlines(self, window: RequestWindow) -> None:
+        if self.deadline is None:
+            return
+
+        for string, future in window.front(self.batch_size):
+            if future in self._deadline_not_started:
+                self._deadline_not_started.discard(future)
+                self._start_deadline(string, future, window)
+
+    def _start_deadline(self, string: str, future: asyncio.Future, window: Optional[RequestWindow]) -> None:
+        timer = asyncio.get_running_loop().call_later(self.deadline, self._pass_deadline, string, future, window)
+        future.add_done_callback(lambda _done_future: timer.cancel())
+
+    def _pass_deadline(self, string: str, future: asyncio.Future, window: Optional[RequestWindow]) -> None:
+        if future.done():
+            return
+
+        self.past_deadline += 1
+        self._overdue.append((string, future, window))
+        self._send_overdue()
+
+    def _send_overdue(self) -> None:
+        # Each overdue request is copied to a different idle helper, while there are any
+        given: List[Union[RequestWindow, Callable[[List[str]], Awaitable[List[Any]]]]] = []
+        still_overdue = []
+        for string, future, window in self._overdue:
+            if future.done():
+                continue
+
+            helper = self._idle_helper(window, given)
+            if helper is None:
+                still_overdue.append((string, future, window))
+                continue
+
+            self.hedged += 1
+            given.append(helper)
+            hedge_future = asyncio.get_running_loop().create_future()
+            self._copies.add(hedge_future)
+            hedge_future.add_done_callback(self._copies.discard)
+            hedge_future.add_done_callback(
+                lambda done_hedge, future=future: self._take_hedge_result(done_hedge, future))
+            # The copy is no longer needed once the request is answered
+            future.add_done_callback(lambda _done_future, hedge_future=hedge_future: hedge_future.cancel())
+            if isinstance(helper, RequestWindow):
+                task = asyncio.create_task(helper.send([(string, hedge_future)]))
+            else:
+                self._in_process_hedges += 1
+                task = asyncio.create_task(self._run_hedge_in_process(helper, string, hedge_future))
+            self._hedge_tasks.add(task)
+            task.add_done_callback(self._hedge_tasks.discard)
+
+        self._overdue = still_overdue
+
+    def _idle_helper(self, exclude: Optional[RequestWindow], given: list
+                     ) -> Optional[Union[RequestWindow, Callable[[List[str]], Awaitable[List[Any]]]]]:
+        # A helper is not idle while there are requests waiting for it
+        if not self._requests.empty():
+            return None
+
+        for window in self.windows:
+            if window is not exclude and window not in given and window.is_empty():
+                return window
+
+        in_process_given = sum(1 for helper in given if not isinstance(helper, RequestWindow))
+        if self._idle_in_process > self._in_process_hedges + in_process_given:
+            return self._in_process_run_batch
+
+        return None
+
+    def _take_hedge_result(self, hedge_future: asyncio.Future, future: asyncio.Future) -> None:
+        # A copy that failed is ignored, as the request it was a copy of may still be answered
+        if hedge_future.cancelled() or hedge_future.exception() is not None:
+            return
+
+        if not future.done():
+            future.set_result(hedge_future.result())
+            self.hedges_won += 1
+
+    async def _run_hedge_in_process(self, run_batch: Callable[[List[str]], Awaitable[List[Any]]], string: str,
+                                    hedge_future: asyncio.Future) -> None:
+        try:
+            results = await run_batch([string])
+        except Exception as e:
+            hedge_future.set_exception(e)
+            return
+        finally:
+            self._in_process_hedges -= 1
+
+        if isinstance(results[0], HelperError):
+            hedge_future.set_exception(results[0])
+        else:
+            hedge_future.set_result(results[0])
+
+    async def _send_to(self, window: RequestWindow) -> None:
+        while True:
+            await window.wait_for_room(self.batch_size)
+            batch = await self._take_batch()
+
+            # A request in flight when a helper crashed is sent on its own to a helper with nothing else in flight, so
+            #  another crash only counts against it
+            suspects = [request for request in batch if request[1] in self._crashes_by_request]
+            batch = [request for request in batch if request[1] not in self._crashes_by_request]
+
+            if batch:
+                self._start_deadlines(batch, window)
+                await window.send(batch)
+                self._start_front_deadlines(window)
+
+            try:
+                while suspects:
+                    await window.wait_for_room(window.window_size)
+                    self._start_deadlines(suspects[:1], window)
+                    await window.send([suspects.pop(0)])
+                    self._start_front_deadlines(window)
+                    await window.wait_for_room(window.window_size)
+            except asyncio.CancelledError:
+                # The helper was lost before they could be sent
+                for request in suspects:
+                    self._requests.put_nowait(request)
+                raise
+
+    async def _run_in_process(self, run_batch: Callable[[List[str]], Awaitable[List[Any]]]) -> None:
+        while True:
+            # Idle while waiting for a batch, so can be given a copy of an overdue request
+            self._idle_in_process += 1
+            try:
+                if self._overdue:
+                    self._send_overdue()
+                batch = await self._take_batch()
+            finally:
+                self._idle_in_process -= 1
+            self._start_deadlines(batch, None)
+
+            # A request in flight when a helper crashed is run on its own, the same as for a helper with a connection
+            suspects = [[request] for request in batch if request[1] in self._crashes_by_request]
+            batch = [request for request in batch if request[1] not in self._crashes_by_request]
+
+            for requests in ([batch] if batch else []) + suspects:
+                await self._run_batch_in_process(run_batch, requests)
+
+    async def _run_batch_in_process(self, run_batch: Callable[[List[str]], Awaitable[List[Any]]],
+                                    batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            results = await run_batch([string for string, _future in batch])
+        except Exception as e:
+            # Treated like a helper that crashed, while this helper keeps taking requests
+            self.crashes += 1
+            for string, future in batch:
+                self._requeue_after_crash(string, future, e)
+            return
+
+        for (_string, future), result in zip(batch, results):
+            if future.done():
+                continue
+
+            # The same as an ERROR message from a helper with a connection
+            if isinstance(result, HelperError):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _receive_from(self, window: RequestWindow, send_task: asyncio.Task) -> None:
+        while True:
+            try:
+                await window.receive()
+                self._start_front_deadlines(window)
+                if self._overdue and window.is_empty():
+                    self._send_overdue()
+            except (ConnectionError, ValueError) as e:
+                send_task.cancel()
+
+                # The helper has closed the connection, which it only does on its own once told to finish, or has sent
+                #  a response that makes no sense, after which nothing more it sends can be trusted
+                if isinstance(e, ConnectionError):
+                    exception = ConnectionError("The helper closed the connection before answering every request")
+                else:
+                    exception = ConnectionError(f"The helper sent a response that could not be understood - {e}")
+                exception.__cause__ = e
+
+                if self._closing:
+                    window.fail(exception)
+                else:
+                    self._lose_helper(window, exception)
+                return
@@ -0,0 +1,132 @@
+import asyncio
+import importlib.util
+import pathlib
+import sys
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from communication import HelperError
+
+# Each thread loading a helper file records the helpers it starts separately
+_capture = threading.local()
+
+
+class InProcessHelper:
+    """
+    The functions a helper file gives to its helper server, called directly by the main handler instead.
+    The functions run in a thread, so the event loop keeps going while they work, and coroutine functions run on the
+     event loop itself.
+    """
+
+    def __init__(self, function: Optional[Callable[[str], Any]] = None,
+                 batch_function: Optional[Callable[[List[str]], List[Any]]] = None,
+                 async_function: Optional[Callable[[str], Awaitable[Any]]] = None, concurrency_limit: int = 1,
+                 convert: Callable[[Any], Any] = lambda result: result) -> None:
+        """
+        :param function: The function that takes a single text, as given to the helper server.
+        :param batch_function: The function that takes a list of texts, as given to the helper server.
+        :param async_function: The coroutine function that takes a single text, as given to the helper server.
+        :param concurrency_limit: The maximum number of calls to the coroutine function running at once.
+        :param convert: Converts each result to what the helper server would have sent, such as a float.
+        """
+
+        self.function: Optional[Callable[[str], Any]] = function
+        self.batch_function: Optional[Callable[[List[str]], List[Any]]] = batch_function
+        self.async_function: Optional[Callable[[str], Awaitable[Any]]] = async_function
+        self.concurrency_limit: int = concurrency_limit
+        self.convert: Callable[[Any], Any] = convert
+
+        # Made once there is an event loop to make it in
+        self._concurrency_semaphore: Optional[asyncio.Semaphore] = None
+
+    async def run_batch(self, strings: List[str]) -> List[Any]:
+        """
+        Runs the helper's functions on a batch of texts, choosing between them the same way the helper server would.
+        A `HelperError` raised for a text is returned in place of its result, as the helper server would send it.
+
+        :param strings: The texts.
+        :return: The results in the same order.
+        :raises ValueError: If the batch function returns the wrong number of results.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if self.async_function is not None:
+            if self._concurrency_semaphore is None:
+                self._concurrency_semaphore = asyncio.Semaphore(self.concurrency_limit)
+
+            async def limited_call(string: str) -> Any:
+                async with self._concurrency_semaphore:
+                    try:
+                        return await self.async_function(string)
+                    except HelperError as e:
+                        return e
+
+            results = await asyncio.gather(*(limited_call(string) for string in strings))
+
+        elif self.batch_function is not None and (len(strings) > 1 or self.function is None):
+            try:
+                results = await loop.run_in_executor(None, self.batch_function, strings)
+            except HelperError as e:
+                results = [e] * len(strings)
+            if len(results) != len(strings):
+                raise ValueError(f"The batch function returned {len(results)} results for {len(strings)} texts")
+
+        else:
+            results = await loop.run_in_executor(None, lambda: [self._call(string) for string in strings])
+
+        return [result if isinstance(result, HelperError) else self.convert(result) for result in results]
+
+    def _call(self, string: str) -> Any:
+        try:
+            return self.function(string)
+        except HelperError as e:
+            return e
+
+
+def capture_helper(**helper_arguments) -> bool:
+    """
+    Called by each helper server before it connects to anything.
+    If the helper file is being loaded by `load_in_process_helper`, the functions given to the helper server are
+     recorded instead, and it should return straight away.
+
+    :param helper_arguments: The arguments for `InProcessHelper`.
+    :return: Whether the helper was captured, in which case the helper server should not start.
+    """
+
+    captured = getattr(_capture, "helpers", None)
+    if captured is None:
+        return False
+
+    captured.append(InProcessHelper(**helper_arguments))
+    return True
+
+
+def load_in_process_helper(helper_file: str) -> InProcessHelper:
+    """
+    Runs a helper file inside this process, capturing the functions it gives to its helper server rather than starting
+     the server.
+    Anything slow the file does first, such as loading a model, happens here.
+
+    :param helper_file: The python file that sets up the helper.
+    :return: The captured helper.
+    :raises ValueError: If the helper file does not call a helper server.
+    """
+
+    helper_filepath = pathlib.Path(helper_file).resolve()
+    module_name = helper_filepath.stem
+    spec = importlib.util.spec_from_file_location(module_name, helper_filepath)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+
+    _capture.helpers = []
+    try:
+        spec.loader.exec_module(module)
+        captured = _capture.helpers
+    finally:
+        _capture.helpers = None
+
+    if not captured:
+        raise ValueError(f"{helper_file} did not call a helper server, so there is nothing to run in process")
+
+    return captured[0]
@@ -1,49 +1,1012 @@
+import asyncio
 import importlib.util
 import json
+import os
 import pathlib
+import shlex
 import shutil
-import socket
 import subprocess
 import sys
+import tempfile
+import time
+import traceback
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
 
 from progress.bar import ChargingBar
+from progress.counter import Counter
 
-from communication import AIDetectorMessages, ParaphraserMessages, ServerMessages
+from communication import AIDetectorMessages, BaseMessages, Endpoint, HelperError, ParaphraserMessages, RequestWindow
+from helper_pool import HelperCrashError, HelperPool
+from in_process_helpers import load_in_process_helper
+from result_cache import ResultCache
+from result_store import ResultStore
+from result_writer import ResultWriter
+from run_journal import RunJournal
 
 
 class MyBar(ChargingBar):
     suffix = "%(percent)d%% (elapsed %(elapsed)ss) (eta %(eta)ss)"
 
 
-def start_process(command):
-    process = subprocess.Popen(
-        command,
-        shell=True
+async def start_process(command):
+    process = await asyncio.create_subprocess_shell(
+        command
     )
 
     return process
 
 
-def create_save(load_data_filename: str,
+# The seconds to wait before restarting a helper that crashed, doubling with each restart up to the maximum
+RESTART_BACKOFF = 1
+MAX_RESTART_BACKOFF = 60
+
+# The backoff goes back to the start once a kind of helper has gone this many seconds without a restart
+RESTART_BACKOFF_RESET = 600
+
+# The number of times in a row a helper can fail to be ready after being restarted before it is given up on
+MAX_FAILED_RESTARTS = 5
+
+# The seconds a restarted helper not known to be ready is given to finish on its own once the helpers are told to
+RESTARTED_FINISH_TIMEOUT = 10
+
+# The tasks killing restarted helpers that have not finished, kept so they are not garbage collected while waiting
+_killing_tasks: Set[asyncio.Task] = set()
+
+
+class HelperStartError(Exception):
+    """Raised when a helper exits or takes too long before it is ready."""
+
+
+def kill(process: asyncio.subprocess.Process) -> None:
+    """
+    Kills a process if it is still running.
+    """
+
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def kill_unless_finished(process: asyncio.subprocess.Process, timeout: float) -> None:
+    """
+    Waits for a process to exit on its own, killing it if it has not within the timeout or if cancelled first.
+    """
+
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        kill(process)
+
+
+def restart_backoff(restarts: int) -> float:
+    """
+    :param restarts: The number of restarts before this one since the backoff was last reset.
+    :return: The seconds to wait before restarting a helper.
+    """
+
+    return min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** restarts)
+
+
+async def supervise_helpers(processes: List[asyncio.subprocess.Process], pool: HelperPool,
+                            connections: asyncio.Queue, command: str, count: int, started: asyncio.Future,
+                            helper_name: str, response_messages: Type[BaseMessages], request_window_size: int) -> None:
+    """
+    Adds each helper to the pool as soon as it says it is ready, then watches over the helper processes until the pool
+     is closed.
+    Until the first helper is ready, a helper exiting or closing its connection means the helpers cannot be started.
+    From then on a helper that exits is restarted with a backoff, and added back to the pool once it is ready.
+    The pool has already put the requests the helper had not answered back in the queue.
+    Restarting is given up on after too many restarted helpers in a row exit without a helper becoming ready, and once
+     no helpers are left the pool is failed.
+    When the pool is closed, a restarted helper not known to be ready is given a little time to finish in case it is
+     one of the helpers told to, then killed.
+
+    :param processes: The helper processes, which are replaced in place as they are restarted.
+    :param pool: The pool of the helpers' connections.
+    :param connections: The queue the listening server puts each new connection's reader and writer in.
+    :param command: The command that starts a helper.
+    :param count: The number of helpers started.
+    :param started:
+        Set once `count` helpers have been ready, or to HelperStartError if the helpers could not be started.
+    """
+
+    exits = {asyncio.create_task(process.wait()): process for process in processes}
+    adding: Set[asyncio.Task] = set()
+    # The restarted processes still running that are not known to have become ready, oldest first
+    restarting: List[asyncio.subprocess.Process] = []
+    # The restarted processes that exited in a row without a restarted helper becoming ready
+    failed_restarts = 0
+    ready_count = 0
+    restarts = 0
+    last_restart = time.monotonic()
+
+    def fail_to_start(message: str, cause: Optional[BaseException] = None) -> None:
+        if not started.done():
+            error = HelperStartError(message)
+            error.__cause__ = cause
+            started.set_exception(error)
+
+    async def add_when_ready(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal ready_count, failed_restarts
+
+        window = RequestWindow(reader, writer, response_messages, request_window_size)
+        try:
+            await window.wait_until_ready()
+        except (ConnectionError, ValueError) as e:
+            # Only stops the run if no helper has been ready, otherwise the helper exiting is dealt with below
+            if ready_count == 0:
+                fail_to_start(f"One of the {helper_name} helpers closed its connection before it was ready", e)
+            return
+
+        pool.add_helper(window)
+        ready_count += 1
+        if restarting:
+            # Which restarted process the connection is from is not known, so the one restarted longest ago is taken
+            restarting.pop(0)
+            failed_restarts = 0
+            print(f"\nThe restarted {helper_name} helper is ready")
+        else:
+            print(f"The {helper_name} helper {ready_count}/{count} is ready")
+
+        if ready_count >= count and not started.done():
+            started.set_result(None)
+
+    async def accept_helpers() -> None:
+        # Helpers can become ready in any order, restarted or not
+        while True:
+            reader, writer = await connections.get()
+            task = asyncio.create_task(add_when_ready(reader, writer))
+            adding.add(task)
+            task.add_done_callback(adding.discard)
+
+    accepting = asyncio.create_task(accept_helpers())
+    try:
+        while exits:
+            done, _pending = await asyncio.wait(exits, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                process = exits.pop(task)
+                processes.remove(process)
+
+                if ready_count == 0:
+                    fail_to_start(f"One of the {helper_name} helpers exited before it was ready")
+                    return
+
+                if process in restarting:
+                    restarting.remove(process)
+                    failed_restarts += 1
+
+                if failed_restarts >= MAX_FAILED_RESTARTS:
+                    print(f"\nGave up on restarting one of the {helper_name} helpers after {MAX_FAILED_RESTARTS} tries")
+                    continue
+
+                if time.monotonic() - last_restart > RESTART_BACKOFF_RESET:
+                    restarts = 0
+                delay = restart_backoff(restarts)
+                restarts += 1
+                print(f"\nOne of the {helper_name} helpers exited, restarting it in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                last_restart = time.monotonic()
+
+                process = await start_process(command)
+                processes.append(process)
+                restarting.append(process)
+                exits[asyncio.create_task(process.wait())] = process
+
+        pool.fail(HelperStartError(f"Every {helper_name} helper crashed and could not be restarted"))
+
+    finally:
+        accepting.cancel()
+        for task in [*exits, *adding]:
+            task.cancel()
+
+        # Not left running if the pool is closed while they start, while any that did become ready are told to finish
+        #  by the pool and given the time to
+        for process in restarting:
+            task = asyncio.create_task(kill_unless_finished(process, RESTARTED_FINISH_TIMEOUT))
+            _killing_tasks.add(task)
+            task.add_done_callback(_killing_tasks.discard)
+
+
+async def supervise_daemons(addresses_by_window: Dict[RequestWindow, str], pool: HelperPool,
+                            timeout_when_accepting_connections: Optional[int], helper_name: str,
+                            response_messages: Type[BaseMessages], request_window_size: int) -> None:
+    """
+    The same as `supervise_helpers` but for helpers running as daemons, reconnecting to any that lose their connection
+     instead of restarting them, as a daemon is left to whoever started it.
+
+    :param addresses_by_window: The endpoint of each daemon by its request window, updated as they reconnect.
+    """
+
+    while True:
+        address = addresses_by_window.pop(await pool.lost_windows.get())
+        print(f"\nLost the connection to the {helper_name} helper at {address}")
+
+        for failed_reconnects in range(MAX_FAILED_RESTARTS):
+            delay = restart_backoff(failed_reconnects)
+            print(f"\nReconnecting to the {helper_name} helper at {address} in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+            try:
+                reader, writer = await Endpoint.parse(address).async_connect()
+                window = RequestWindow(reader, writer, response_messages, request_window_size)
+                await asyncio.wait_for(window.wait_until_ready(), timeout_when_accepting_connections)
+            except (OSError, ValueError, asyncio.TimeoutError):
+                continue
+
+            addresses_by_window[window] = address
+            pool.add_helper(window)
+            print(f"\nReconnected to the {helper_name} helper at {address}")
+            break
+        else:
+            print(f"\nGave up on reconnecting to the {helper_name} helper at {address}")
+            if not addresses_by_window:
+                pool.fail(HelperStartError(f"Lost the connection to every {helper_name} helper"))
+
+
+async def start_server(endpoint: Endpoint) -> Tuple[asyncio.AbstractServer, asyncio.Queue, Endpoint]:
+    """
+    Creates a server for helpers to connect to.
+
+    :param endpoint: The endpoint to listen at, where a TCP port of 0 is given a free port.
+    :return:
+        The server, the queue it puts each new connection's reader and writer in and the endpoint it is actually
+         listening at.
+    """
+
+    connections = asyncio.Queue()
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await connections.put((reader, writer))
+
+    server, endpoint = await endpoint.async_listen(on_connection)
+
+    return server, connections, endpoint
+
+
+async def start_helpers(connections: asyncio.Queue, command: str, count: int,
+                        timeout_when_accepting_connections: Optional[int], helper_name: str,
+                        response_messages: Type[BaseMessages], request_window_size: int, batch_size: int,
+                        deduplicate: bool, remember_results: bool = True, deadline: Optional[float] = None,
+                        max_crashes: int = 3) -> Tuple[List[asyncio.subprocess.Process], HelperPool, asyncio.Task]:
+    """
+    Starts `count` helper processes running the same command, adding each to a pool as soon as it says it is ready.
+    Requests can be given to the pool straight away, and are sent once a helper is ready for them.
+    The helpers are watched over by `supervise_helpers` from the start, so once one is ready any that crash are
+     restarted.
+
+    :param connections: The queue the listening server puts each new connection's reader and writer in.
+    :param command: The command that starts a helper.
+    :param count: The number of helpers to start.
+    :param timeout_when_accepting_connections:
+        The maximum amount of time to wait for every helper to be ready, or None to wait as long as they are running.
+    :param helper_name: The name of the helper used when printing.
+    :param response_messages: The message types the helpers respond with.
+    :param request_window_size: The maximum number of requests in flight with each helper.
+    :param batch_size: The maximum number of requests to send to a helper in one message.
+    :param deduplicate: Whether the pool only sends each unique string to the helpers once.
+    :param remember_results: Whether the pool keeps results to share with later requests for the same string.
+    :param deadline:
+        The number of seconds a request can go unanswered before the pool sends a copy to an idle helper, or None to
+         never send copies.
+    :param max_crashes: The number of helper crashes a request can be in flight for before it is given up on.
+    :return:
+        The helper processes, the pool of their connections and the task adding them to the pool.
+        The task raises HelperStartError if a helper exits before any is ready or the timeout passes before every
+         helper is ready.
+    """
+
+    processes = [await start_process(command) for _ in range(count)]
+    pool = HelperPool(batch_size, deduplicate, remember_results, deadline, max_crashes)
+
+    started = asyncio.get_running_loop().create_future()
+    pool.watch(supervise_helpers(processes, pool, connections, command, count, started, helper_name,
+                                 response_messages, request_window_size))
+
+    async def add_helpers() -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(started), timeout_when_accepting_connections)
+        except asyncio.TimeoutError:
+            raise HelperStartError(f"Timed out waiting for the {helper_name} helpers to be ready") from None
+
+    return processes, pool, asyncio.create_task(add_helpers())
+
+
+async def attach_helpers(addresses: List[str], timeout_when_accepting_connections: Optional[int], helper_name: str,
+                         response_messages: Type[BaseMessages], request_window_size: int, batch_size: int,
+                         deduplicate: bool, remember_results: bool = True, deadline: Optional[float] = None,
+                         max_crashes: int = 3) -> Tuple[List[asyncio.subprocess.Process], HelperPool, asyncio.Task]:
+    """
+    The same as `start_helpers` but connects to helpers already running as daemons instead of starting new ones.
+    A daemon serving another handler server only says it is ready once it has finished with it.
+    Once every daemon is ready they are watched over by `supervise_daemons`, so any that lose their connection are
+     reconnected to.
+
+    :param addresses: The endpoint of each daemon, written as `host:port` or `unix:path`.
+    :return:
+        No processes, as the daemons are left running, the pool of their connections and the task adding them to the
+         pool.
+        The task raises HelperStartError if a daemon cannot be connected to or the timeout passes before every daemon
+         is ready.
+    """
+
+    pool = HelperPool(batch_size, deduplicate, remember_results, deadline, max_crashes)
+    addresses_by_window = {}
+
+    async def add_when_ready(address: str) -> None:
+        try:
+            reader, writer = await Endpoint.parse(address).async_connect()
+            window = RequestWindow(reader, writer, response_messages, request_window_size)
+            await window.wait_until_ready()
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            raise HelperStartError(f"Could not attach to the {helper_name} helper at {address}: {e}") from e
+        addresses_by_window[window] = address
+        pool.add_helper(window)
+        print(f"The {helper_name} helper at {address} is ready")
+
+    async def add_helpers() -> None:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(add_when_ready(address) for address in addresses)),
+                                   timeout_when_accepting_connections)
+        except asyncio.TimeoutError:
+            raise HelperStartError(f"Timed out waiting for the {helper_name} helpers to be ready") from None
+
+        pool.watch(supervise_daemons(addresses_by_window, pool, timeout_when_accepting_connections, helper_name,
+                                     response_messages, request_window_size))
+
+    return [], pool, asyncio.create_task(add_helpers())
+
+
+async def start_in_process_helpers(helper_file: str, count: int, helper_name: str, batch_size: int,
+                                   deduplicate: bool, remember_results: bool = True, deadline: Optional[float] = None,
+                                   max_crashes: int = 3
+                                   ) -> Tuple[List[asyncio.subprocess.Process], HelperPool, asyncio.Task]:
+    """
+    The same as `start_helpers` but loads the helper file into this process, calling its functions directly instead of
+     sending messages to a helper process.
+    The helper file is loaded in a thread, so the other kind of helper can load at the same time.
+    An exception raised by the helper's functions counts as a crash, without anything needing to be restarted.
+
+    :param helper_file: The python file that sets up the helper.
+    :param count: The number of batches that can be run at once.
+    :return:
+        No processes, the pool and the task adding the helper to the pool once the helper file is loaded.
+        The task raises HelperStartError if the helper file cannot be loaded.
+    """
+
+    pool = HelperPool(batch_size, deduplicate, remember_results, deadline, max_crashes)
+
+    async def add_when_loaded() -> None:
+        try:
+            helper = await asyncio.get_running_loop().run_in_executor(None, load_in_process_helper, helper_file)
+        except Exception as e:
+            traceback.print_exc()
+            raise HelperStartError(f"The {helper_name} helper file could not be loaded: {e}") from e
+
+        for _ in range(count):
+            pool.add_in_process_helper(helper.run_batch)
+        print(f"The {helper_name} helper is loaded in process")
+
+    return [], pool, asyncio.create_task(add_when_loaded())
+
+
+async def finish_helpers(processes: List[asyncio.subprocess.Process], pool: HelperPool, adding: asyncio.Task) -> None:
+    """
+    Tells every helper in the pool to finish and waits for the processes to terminate.
+    Helpers running as daemons stay running, ready for the next handler server.
+    Waits for every helper to be added to the pool first, so none are left running.
+    """
+
+    await adding
+    await pool.close()
+
+    for process in processes:
+        await process.wait()
+
+
+async def create_servers(transport: str) -> Tuple[Optional[str], Tuple[asyncio.AbstractServer, asyncio.Queue, Endpoint],
+                                                  Tuple[asyncio.AbstractServer, asyncio.Queue, Endpoint]]:
+    """
+    Creates a server for each kind of helper to connect to, at endpoints only this run uses.
+
+    :param transport: The transport of the endpoints, either tcp or unix.
+    :return:
+        The temporary directory holding the unix sockets, or None if using tcp.
+        Then the server, connection queue and endpoint from `start_server` for the paraphrasers and for the AI
+         detectors.
+    """
+
+    if transport == "unix":
+        endpoint_directory = tempfile.mkdtemp(prefix="helper_endpoints_")
+        paraphraser_endpoint = Endpoint("unix", os.path.join(endpoint_directory, "paraphraser.sock"))
+        ai_detector_endpoint = Endpoint("unix", os.path.join(endpoint_directory, "ai_detector.sock"))
+    else:
+        endpoint_directory = None
+        # The operating system picks a free port for each
+        paraphraser_endpoint = Endpoint("tcp", ("localhost", 0))
+        ai_detector_endpoint = Endpoint("tcp", ("localhost", 0))
+
+    return endpoint_directory, await start_server(paraphraser_endpoint), await start_server(ai_detector_endpoint)
+
+
+async def close_servers(servers: List[asyncio.AbstractServer], endpoint_directory: Optional[str]) -> None:
+    """
+    Closes the servers from `create_servers` and removes the directory holding their unix sockets.
+    """
+
+    for server in servers:
+        server.close()
+    for server in servers:
+        await server.wait_closed()
+
+    if endpoint_directory is not None:
+        shutil.rmtree(endpoint_directory, ignore_errors=True)
+
+
+async def start_helper_kind(helper_name: str, response_messages: Type[BaseMessages], addresses: List[str],
+                            in_process: bool, helper_file: str, conda_env: str, connections: asyncio.Queue,
+                            endpoint: Endpoint, workers: int, timeout_when_accepting_connections: Optional[int],
+                            request_window_size: int, batch_size: int, deduplicate: bool,
+                            remember_results: bool = True, deadline: Optional[float] = None, max_crashes: int = 3
+                            ) -> Tuple[List[asyncio.subprocess.Process], HelperPool, asyncio.Task]:
+    """
+    Gets one kind of helper going in whichever way was asked for.
+    If addresses are given the daemons at those addresses are attached to, otherwise if in process the helper file is
+     loaded into this process, otherwise the helpers are started and told to connect to the endpoint.
+
+    :return: The same as `start_helpers`.
+    """
+
+    if addresses:
+        print(f"Attaching to the {helper_name} helpers")
+        return await attach_helpers(addresses, timeout_when_accepting_connections, helper_name, response_messages,
+                                    request_window_size, batch_size, deduplicate, remember_results, deadline,
+                                    max_crashes)
+
+    if in_process:
+        print(f"Loading the {helper_name} helper in process")
+        return await start_in_process_helpers(helper_file, workers, helper_name, batch_size, deduplicate,
+                                              remember_results, deadline, max_crashes)
+
+    print(f"Starting the {helper_name} helpers")
+    command = f"conda run -n {conda_env} python {helper_file} --connect {shlex.quote(str(endpoint))}"
+    return await start_helpers(connections, command, workers, timeout_when_accepting_connections, helper_name,
+                               response_messages, request_window_size, batch_size, deduplicate, remember_results,
+                               deadline, max_crashes)
+
+
+def write_hedging_stats(save_path: pathlib.Path, paraphrasers: Optional[HelperPool],
+                        ai_detectors: Optional[HelperPool]) -> None:
+    """
+    Writes how often each kind of helper's requests went past the deadline and were hedged to `hedging.json` in the
+     save directory, and prints a summary.
+    Only written if either kind of helper has a deadline, replacing the stats of any run before it.
+    """
+
+    pools = {"paraphraser": paraphrasers, "ai_detector": ai_detectors}
+    if not any(pool is not None and pool.deadline is not None for pool in pools.values()):
+        return
+
+    stats = {name: pool.hedging_stats() for name, pool in pools.items() if pool is not None}
+    with open(save_path / "hedging.json", "w", encoding="UTF-8") as f:
+        json.dump(stats, f, indent=4)
+
+    for name, helper_stats in stats.items():
+        if helper_stats["deadline"] is not None:
+            print(f"Hedging - {helper_stats['past_deadline']}/{helper_stats['requests_sent']} {name} request(s) went "
+                  f"past the {helper_stats['deadline']}s deadline, {helper_stats['hedged']} hedged and "
+                  f"{helper_stats['hedges_won']} answered first by the copy")
+
+
+def print_crash_stats(paraphrasers: Optional[HelperPool], ai_detectors: Optional[HelperPool]) -> None:
+    """
+    Prints how often each kind of helper crashed, if it did at all.
+    """
+
+    for name, pool in (("paraphraser", paraphrasers), ("AI detector", ai_detectors)):
+        if pool is not None and pool.crashes:
+            print(f"Crashes - the {name} helpers crashed {pool.crashes} time(s), {pool.requeued} request(s) were "
+                  f"sent again and {pool.given_up} given up on")
+
+
+def print_error_counts(error_counts: Dict[str, int]) -> None:
+    """
+    Prints how many results the helpers could not give, by error code, if there were any.
+    """
+
+    if error_counts:
+        print(f"Errors - the helpers could not give {sum(error_counts.values())} result(s), "
+              + ", ".join(f"{count} {code}" for code, count in sorted(error_counts.items())))
+
+
+async def run_helpers(combined_data: ResultStore, journal: RunJournal, writer: ResultWriter,
+                      cache: Optional[ResultCache],
+                      paraphraser_file: str, paraphraser_conda_env: str,
+                      ai_detector_file: str, ai_detector_conda_env: str,
+                      timeout_when_accepting_connections: Optional[int], request_window_size: int, batch_size: int,
+                      paraphraser_workers: int, ai_detector_workers: int, streaming: bool, deduplicate: bool,
+                      paraphraser_addresses: List[str], ai_detector_addresses: List[str], transport: str,
+                      in_process: bool, paraphraser_deadline: Optional[float] = None,
+                      ai_detector_deadline: Optional[float] = None, max_crashes: int = 3) -> bool:
+    """
+    Starts the helpers and fills in the paraphrased texts and AI percentages of the combined data that are missing.
+    Every helper connection is driven from the one event loop.
+    Both kinds of helper are started straight away and given requests as soon as each says it is ready.
+    If addresses are given for a kind of helper, the daemons at those addresses are used instead of starting any.
+    The helpers started are told to connect to endpoints made for this run over the given transport, so several runs
+     can share a machine.
+    If in process, the helper files are loaded into this process and their functions called directly instead.
+    Results found in the cache are used instead of sending the text to a helper, and a kind of helper is only started
+     if it has something to do.
+    If deduplicating, each unique text is only sent to a kind of helper once, with the result copied to every row that
+     shares it.
+    Each row is given to the writer as soon as it has all of its results.
+    A request to a kind of helper still unanswered after its deadline is copied to an idle helper of the same kind,
+     with how often this happened written to the save directory.
+    A helper that crashes is restarted and its requests sent again, while a result whose request was in flight for
+     `max_crashes` crashes is given up on and left missing, to be tried again by resuming the run.
+    A result a helper could not give is recorded with the error saying why, and a paraphrased text that could not be
+     given is not sent for detection.
+    These are not tried again by resuming the run, as they are the helper's answer, but are not cached either.
+
+    :return: Whether every helper could be started.
+    """
+
+    row_count = len(combined_data)
+
+    paraphraser_key = ResultCache.helper_key(paraphraser_file, paraphraser_conda_env)
+    ai_detector_key = ResultCache.helper_key(ai_detector_file, ai_detector_conda_env)
+
+    def write_if_finished(i: int) -> None:
+        if not writer.is_written(i, combined_data.original_text[i]) and combined_data.is_finished(i):
+            writer.write_row(i, *(combined_data.get(column, i) for column in ResultStore.COLUMNS),
+                             errors=combined_data.errors.get(i))
+
+    def fill_from_cache(i: int, column: str, helper_key: str, text: str) -> bool:
+        # Whether the result was found in the cache, in which case it is stored and recorded in the journal
+        if cache is None:
+            return False
+
+        value = cache.get(helper_key, text)
+        if value is None:
+            return False
+
+        combined_data.set(column, i, value)
+        journal.record(i, combined_data.original_text[i], column, value)
+        write_if_finished(i)
+        return True
+
+    def is_unsettled(i: int, column: str) -> bool:
+        # Missing without a helper having said why it could not be given
+        return combined_data.is_missing(column, i) and combined_data.get_error(column, i) is None
+
+    def is_missing_paraphrase(i: int) -> bool:
+        return is_unsettled(i, "paraphrased_text") and \
+            not fill_from_cache(i, "paraphrased_text", paraphraser_key, combined_data.original_text[i])
+
+    def is_missing_original_detection(i: int) -> bool:
+        return is_unsettled(i, "original_detection") and \
+            not fill_from_cache(i, "original_detection", ai_detector_key, combined_data.original_text[i])
+
+    def is_missing_paraphrased_detection(i: int) -> bool:
+        # Can only be found in the cache once the paraphrased text is known, and is not needed if it could not be
+        return is_unsettled(i, "paraphrased_detection") and \
+            combined_data.get_error("paraphrased_text", i) is None and \
+            (combined_data.is_missing("paraphrased_text", i) or
+             not fill_from_cache(i, "paraphrased_detection", ai_detector_key, combined_data.paraphrased_text[i]))
+
+    # Only the results that are missing are sent to the helpers
+    rows_to_paraphrase = [i for i in range(row_count) if is_missing_paraphrase(i)]
+    rows_to_detect_original = [i for i in range(row_count) if is_missing_original_detection(i)]
+    rows_to_detect_paraphrased = [i for i in range(row_count) if is_missing_paraphrased_detection(i)]
+
+    # The rows already finished from the journal are written out straight away
+    for i in range(row_count):
+        write_if_finished(i)
+
+    # Creating a server for each kind of helper to connect to for communication, at endpoints only this run uses
+    print("Creating the servers")
+    endpoint_directory, (paraphraser_server, paraphraser_connections, paraphraser_endpoint), \
+        (ai_detector_server, ai_detector_connections, ai_detector_endpoint) = await create_servers(transport)
+
+    # Storing the results as they arrive, and recording them in the journal
+    progress = None
+    paraphrasers = None
+    ai_detectors = None
+
+    given_up_rows: Set[int] = set()
+    error_counts: Dict[str, int] = {}
+
+    def give_up(i: int) -> None:
+        # Left missing, so resuming the run tries again
+        given_up_rows.add(i)
+
+        # Update the progress bar
+        progress.next()
+
+    def store_error(i: int, column: str, error: HelperError) -> None:
+        # Left missing with the reason why, which is not cached as the helper may be able to give it another time
+        combined_data.set_error(column, i, error.code, error.text)
+        journal.record_error(i, combined_data.original_text[i], column, error.code, error.text)
+        error_counts[error.code] = error_counts.get(error.code, 0) + 1
+        write_if_finished(i)
+
+        # Update the progress bar
+        progress.next()
+
+    def store(i: int, column: str, helper_key: str, text: str, value) -> None:
+        combined_data.set(column, i, value)
+        journal.record(i, combined_data.original_text[i], column, value)
+        if cache is not None:
+            cache.put(helper_key, text, value)
+        write_if_finished(i)
+
+        # Update the progress bar
+        progress.next()
+
+    async def request(i: int, column: str, helper_key: str, text: str, pool: HelperPool) -> None:
+        try:
+            value = await pool.request(text)
+        except HelperCrashError:
+            give_up(i)
+            return
+        except HelperError as e:
+            store_error(i, column, e)
+            return
+
+        store(i, column, helper_key, text, value)
+
+    async def paraphrase(i: int) -> None:
+        await request(i, "paraphrased_text", paraphraser_key, combined_data.original_text[i], paraphrasers)
+
+    async def detect_original(i: int) -> None:
+        await request(i, "original_detection", ai_detector_key, combined_data.original_text[i], ai_detectors)
+
+    async def detect_paraphrased(i: int) -> None:
+        await request(i, "paraphrased_detection", ai_detector_key, combined_data.paraphrased_text[i], ai_detectors)
+
+    # Starting the paraphraser and AI detector helpers alongside each other, so they load at the same time
+    # Each kind of helper is only started if it has something to do
+    needs_paraphrasers = bool(rows_to_paraphrase)
+    needs_ai_detectors = bool(rows_to_detect_original or rows_to_detect_paraphrased)
+
+    if needs_paraphrasers:
+        paraphraser_processes, paraphrasers, adding_paraphrasers = await start_helper_kind(
+            "paraphraser", ParaphraserMessages, paraphraser_addresses, in_process, paraphraser_file,
+            paraphraser_conda_env, paraphraser_connections, paraphraser_endpoint, paraphraser_workers,
+            timeout_when_accepting_connections, request_window_size, batch_size, deduplicate,
+            deadline=paraphraser_deadline, max_crashes=max_crashes)
+
+    if needs_ai_detectors:
+        ai_detector_processes, ai_detectors, adding_ai_detectors = await start_helper_kind(
+            "AI detector", AIDetectorMessages, ai_detector_addresses, in_process, ai_detector_file,
+            ai_detector_conda_env, ai_detector_connections, ai_detector_endpoint, ai_detector_workers,
+            timeout_when_accepting_connections, request_window_size, batch_size, deduplicate,
+            deadline=ai_detector_deadline, max_crashes=max_crashes)
+
+    try:
+        if streaming:
+            # Communication time, with requests sent to each helper as soon as it is ready
+
+            progress = MyBar(f"Paraphrasing and calculating AI percentages",
+                             max=len(rows_to_paraphrase) + len(rows_to_detect_original) +
+                             len(rows_to_detect_paraphrased))
+
+            waiting_for_paraphrase = set(rows_to_paraphrase)
+            waiting_for_detection = set(rows_to_detect_paraphrased)
+            rows_to_paraphrase_or_detect = sorted(waiting_for_paraphrase | waiting_for_detection)
+
+            async def paraphrase_then_detect(i: int) -> None:
+                if i in waiting_for_paraphrase:
+                    await paraphrase(i)
+
+                    # Nothing to detect if the paraphrase was given up on or could not be given
+                    if combined_data.is_missing("paraphrased_text", i):
+                        if i in waiting_for_detection:
+                            progress.next()
+                        return
+
+                    # The new paraphrased text may already have been seen by the AI detector
+                    if not is_missing_paraphrased_detection(i):
+                        progress.next()
+                        return
+
+                if i in waiting_for_detection:
+                    await detect_paraphrased(i)
+
+            # The original texts go to the AI detectors straight away and each paraphrased text as soon as it arrives
+            # Waiting on the helpers being added as well, so one failing to start stops the run
+            await asyncio.gather(*(detect_original(i) for i in rows_to_detect_original),
+                                 *(paraphrase_then_detect(i) for i in rows_to_paraphrase_or_detect),
+                                 *([adding_paraphrasers] if needs_paraphrasers else []),
+                                 *([adding_ai_detectors] if needs_ai_detectors else []))
+
+            # Done with the progress bar
+            progress.finish()
+
+            # Finally tell the helpers to finish and wait for them to terminate
+            print("Tell the paraphrasers and AI detectors to finish")
+            if needs_paraphrasers:
+                await finish_helpers(paraphraser_processes, paraphrasers, adding_paraphrasers)
+            if needs_ai_detectors:
+                await finish_helpers(ai_detector_processes, ai_detectors, adding_ai_detectors)
+
+        else:
+            if needs_paraphrasers:
+                # Communication time, with requests sent to each paraphraser as soon as it is ready
+
+                progress = MyBar(f"Paraphrasing", max=len(rows_to_paraphrase))
+
+                # Sending strings and receiving the results from the paraphrasers
+                await asyncio.gather(*(paraphrase(i) for i in rows_to_paraphrase), adding_paraphrasers)
+
+                # Done with the progress bar
+                progress.finish()
+
+                # Finally tell the paraphrasers to finish, waiting for them to terminate alongside the AI detectors, as
+                #  one may still be working on a request answered first by another
+                print("Tell the paraphrasers to finish")
+                finishing_paraphrasers = asyncio.create_task(
+                    finish_helpers(paraphraser_processes, paraphrasers, adding_paraphrasers))
+
+                # The new paraphrased texts may already have been seen by the AI detector, and there is nothing to
+                #  detect for the paraphrases given up on or that could not be given
+                newly_paraphrased = set(rows_to_paraphrase)
+                rows_to_detect_paraphrased = [i for i in rows_to_detect_paraphrased
+                                              if not combined_data.is_missing("paraphrased_text", i) and
+                                              (i not in newly_paraphrased or is_missing_paraphrased_detection(i))]
+
+            if needs_ai_detectors:
+                # Communication time, with the AI detectors having loaded while the texts were paraphrased
+
+                progress = MyBar(f"Calculating AI percentages",
+                                 max=len(rows_to_detect_original) + len(rows_to_detect_paraphrased))
+
+                # Sending strings and receiving the results from the AI detectors
+                await asyncio.gather(*(detect_original(i) for i in rows_to_detect_original),
+                                     *(detect_paraphrased(i) for i in rows_to_detect_paraphrased),
+                                     adding_ai_detectors)
+
+                # Done with the progress bar
+                progress.finish()
+
+                # Finally tell the AI detectors to finish and wait for them to terminate
+                print("Tell the AI detectors to finish")
+                await finish_helpers(ai_detector_processes, ai_detectors, adding_ai_detectors)
+
+            if needs_paraphrasers:
+                await finishing_paraphrasers
+
+    except HelperStartError as e:
+        print(e)
+        return False
+
+    finally:
+        await close_servers([paraphraser_server, ai_detector_server], endpoint_directory)
+
+    if cache is not None:
+        print(f"Result cache - {cache.hits} hit(s), {cache.misses} miss(es)")
+    if deduplicate:
+        paraphraser_calls_saved = paraphrasers.duplicate_requests if paraphrasers is not None else 0
+        ai_detector_calls_saved = ai_detectors.duplicate_requests if ai_detectors is not None else 0
+        print(f"Deduplication - saved {paraphraser_calls_saved} paraphraser call(s) and {ai_detector_calls_saved} AI "
+              f"detector call(s)")
+    write_hedging_stats(writer.save_path, paraphrasers, ai_detectors)
+    print_crash_stats(paraphrasers, ai_detectors)
+    print_error_counts(error_counts)
+    if given_up_rows:
+        print(f"Gave up on results for {len(given_up_rows)} row(s) after they crashed the helpers too many times, "
+              f"resume the run to try them again")
+
+    return True
+
+
+async def run_helpers_on_records(records: Iterable[Tuple[str, bool]], writer: ResultWriter,
+                                 cache: Optional[ResultCache],
+                                 paraphraser_file: str, paraphraser_conda_env: str,
+                                 ai_detector_file: str, ai_detector_conda_env: str,
+                                 timeout_when_accepting_connections: Optional[int], request_window_size: int,
+                                 batch_size: int, paraphraser_workers: int, ai_detector_workers: int,
+                                 deduplicate: bool, paraphraser_addresses: List[str], ai_detector_addresses: List[str],
+                                 transport: str, in_process: bool, rows_in_flight: int,
+                                 paraphraser_deadline: Optional[float] = None,
+                                 ai_detector_deadline: Optional[float] = None, max_crashes: int = 3) -> bool:
+    """
+    The same as `run_helpers` but for records read one at a time instead of the combined data.
+    Each record is sent to the helpers as soon as it is read, with its paraphrased text sent to the AI detectors as
+     soon as it arrives.
+    No more than `rows_in_flight` rows are held at once, so memory stays bounded however many records there are.
+    Rows already written, from a run that stopped early, are skipped.
+    A row with a result given up on after crashing the helpers too many times is not written, so resuming the run
+     tries it again.
+    A row with a result a helper could not give is written with the error saying why, the same as by `run_helpers`.
+    Both kinds of helper are started, as what needs doing is only known once the records are read.
+
+    :param records: The original text of each row and whether it is AI generated.
+    :return: Whether every helper could be started.
+    """
+
+    paraphraser_key = ResultCache.helper_key(paraphraser_file, paraphraser_conda_env)
+    ai_detector_key = ResultCache.helper_key(ai_detector_file, ai_detector_conda_env)
+
+    # Creating a server for each kind of helper to connect to for communication, at endpoints only this run uses
+    print("Creating the servers")
+    endpoint_directory, (paraphraser_server, paraphraser_connections, paraphraser_endpoint), \
+        (ai_detector_server, ai_detector_connections, ai_detector_endpoint) = await create_servers(transport)
+
+    # Results are only shared between requests waiting at the same time, the cache shares them with the rest
+    paraphraser_processes, paraphrasers, adding_paraphrasers = await start_helper_kind(
+        "paraphraser", ParaphraserMessages, paraphraser_addresses, in_process, paraphraser_file,
+        paraphraser_conda_env, paraphraser_connections, paraphraser_endpoint, paraphraser_workers,
+        timeout_when_accepting_connections, request_window_size, batch_size, deduplicate, remember_results=False,
+        deadline=paraphraser_deadline, max_crashes=max_crashes)
+    ai_detector_processes, ai_detectors, adding_ai_detectors = await start_helper_kind(
+        "AI detector", AIDetectorMessages, ai_detector_addresses, in_process, ai_detector_file,
+        ai_detector_conda_env, ai_detector_connections, ai_detector_endpoint, ai_detector_workers,
+        timeout_when_accepting_connections, request_window_size, batch_size, deduplicate, remember_results=False,
+        deadline=ai_detector_deadline, max_crashes=max_crashes)
+
+    async def get_result(pool: HelperPool, helper_key: str, text: str):
+        # Results found in the cache are used instead of sending the text to a helper
+        if cache is not None:
+            value = cache.get(helper_key, text)
+            if value is not None:
+                return value
+
+        value = await pool.request(text)
+        if cache is not None:
+            cache.put(helper_key, text, value)
+
+        return value
+
+    progress = None
+    rows_left = asyncio.Semaphore(rows_in_flight)
+    row_tasks: Set[asyncio.Task] = set()
+    failures: List[BaseException] = []
+    given_up_rows = 0
+    error_counts: Dict[str, int] = {}
+
+    async def run_row(i: int, text: str, is_ai: bool) -> None:
+        nonlocal given_up_rows
+
+        errors: Dict[str, Tuple[str, str]] = {}
+
+        async def get_result_or_error(column: str, pool: HelperPool, helper_key: str, text_to_send: str):
+            # A result the helper could not give is None, with the error saying why recorded for the row
+            try:
+                return await get_result(pool, helper_key, text_to_send)
+            except HelperError as e:
+                errors[column] = (e.code, e.text)
+                return None
+
+        async def paraphrase_then_detect() -> Tuple[Optional[str], Optional[float]]:
+            paraphrased_text = await get_result_or_error("paraphrased_text", paraphrasers, paraphraser_key, text)
+
+            # Nothing to detect if the paraphrase could not be given
+            if paraphrased_text is None:
+                return None, None
+
+            return paraphrased_text, await get_result_or_error("paraphrased_detection", ai_detectors,
+                                                               ai_detector_key, paraphrased_text)
+
+        try:
+            original_detection, (paraphrased_text, paraphrased_detection) = await asyncio.gather(
+                get_result_or_error("original_detection", ai_detectors, ai_detector_key, text),
+                paraphrase_then_detect())
+        except HelperCrashError:
+            # Left unwritten, so resuming the run tries again
+            given_up_rows += 1
+            progress.next()
+            return
+
+        writer.write_row(i, text, is_ai, paraphrased_text, original_detection, paraphrased_detection, errors=errors)
+        for code, _text in errors.values():
+            error_counts[code] = error_counts.get(code, 0) + 1
+
+        # Update the progress counter
+        progress.next()
+
+    def row_done(task: asyncio.Task) -> None:
+        row_tasks.discard(task)
+        rows_left.release()
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    async def send_records() -> None:
+        for i, (text, is_ai) in enumerate(records):
+            # A row written by the run before is only skipped if its text is the same, as the records may have changed
+            if writer.is_written(i, text):
+                continue
+
+            # No more records are read until a row finishes once the limit is reached
+            await rows_left.acquire()
+            if failures:
+                raise failures[0]
+
+            task = asyncio.create_task(run_row(i, text, bool(is_ai)))
+            row_tasks.add(task)
+            task.add_done_callback(row_done)
+
+        await asyncio.gather(*row_tasks)
+        if failures:
+            raise failures[0]
+
+    try:
+        # Communication time, with each record sent to the helpers as soon as it is read
+        progress = Counter("Rows finished ")
+
+        # Waiting on the helpers being added as well, so one failing to start stops the run
+        await asyncio.gather(send_records(), adding_paraphrasers, adding_ai_detectors)
+
+        # Done with the progress counter
+        progress.finish()
+
+        # Finally tell the helpers to finish and wait for them to terminate
+        print("Tell the paraphrasers and AI detectors to finish")
+        await finish_helpers(paraphraser_processes, paraphrasers, adding_paraphrasers)
+        await finish_helpers(ai_detector_processes, ai_detectors, adding_ai_detectors)
+
+    except HelperStartError as e:
+        print(e)
+        return False
+
+    finally:
+        await close_servers([paraphraser_server, ai_detector_server], endpoint_directory)
+
+    if cache is not None:
+        print(f"Result cache - {cache.hits} hit(s), {cache.misses} miss(es)")
+    if deduplicate:
+        print(f"Deduplication - saved {paraphrasers.duplicate_requests} paraphraser call(s) and "
+              f"{ai_detectors.duplicate_requests} AI detector call(s)")
+    write_hedging_stats(writer.save_path, paraphrasers, ai_detectors)
+    print_crash_stats(paraphrasers, ai_detectors)
+    print_error_counts(error_counts)
+    if given_up_rows:
+        print(f"Gave up on {given_up_rows} row(s) after they crashed the helpers too many times, resume the run to "
+              f"try them again")
+
+    return True
+
+
+def create_save_directory() -> pathlib.Path:
+    """
+    Creates a new save directory for the results of a run, named after the current time.
+    Runs started in the same second are given a directory each, numbered after the first, so no two runs ever share
+     one.
+
+    :return: The path to the save directory.
+    """
+
+    save_dir_name = f"{datetime.now().strftime('%Y-%m-%d %H;%M;%S')}"
+    pathlib.Path("results").mkdir(exist_ok=True)
+
+    number = 1
+    while True:
+        save_path = pathlib.Path("results/" + save_dir_name + (f" ({number})" if number > 1 else "")).resolve()
+        try:
+            save_path.mkdir()
+        except FileExistsError:
+            number += 1
+            continue
+
+        return save_path
+
+
+def create_save(save_path: pathlib.Path, load_data_filename: str,
                 paraphraser_file: str, paraphraser_conda_env: str,
                 ai_detector_file: str, ai_detector_conda_env: str,
-                combined_data: dict) -> None:
+                writer: ResultWriter) -> None:
     """
-    Creates a save directory.
-    Saves the results from the current to a file.
+    Saves the results from the current run to the save directory in columns, from the rows the writer has written.
     Then copies over the necessary files to recreate the results.
     """
 
-    print("create_save - Creating save directory")
-    save_dir_name = f"{datetime.now().strftime('%Y-%m-%d %H;%M;%S')}"
-    save_path = pathlib.Path("results/" + save_dir_name).resolve()
-    save_path.mkdir(parents=True, exist_ok=True)
-
-    # Writing the results to a file
-    print("create_save - Writing results to a file")
-    with open(save_path / "paraphrased_results.json", "w") as f:
-        f.write(json.dumps(combined_data))
+    # Writing the results in columns
+    print("create_save - Writing results in columns")
+    writer.finalize()
 
     # Copying over some files to a save directory
     print("create_save - Copying over python files")
@@ -79,14 +1042,21 @@ def create_save(load_data_filename: str,
 
     # Writing some extra information
     print("create_save - Writing execution command")
-    with open(save_path / "execution_command.txt", "w") as f:
+    # A resumed run adds its command after the commands of the runs before it
+    with open(save_path / "execution_command.txt", "a") as f:
         print(f"python {' '.join(sys.argv)}", file=f)
 
 
 def main(load_data_filename: str,
          paraphraser_file: str, paraphraser_conda_env: str,
          ai_detector_file: str, ai_detector_conda_env: str,
-         timeout_when_accepting_connections: int = 5):
+         timeout_when_accepting_connections: Optional[int] = None, request_window_size: int = 8, batch_size: int = 1,
+         paraphraser_workers: int = 1, ai_detector_workers: int = 1, streaming: bool = False,
+         resume_path: Optional[str] = None, cache_path: Optional[str] = "cache", cache_max_size_mb: int = 1024,
+         deduplicate: bool = True, paraphraser_addresses: Optional[List[str]] = None,
+         ai_detector_addresses: Optional[List[str]] = None, transport: str = "tcp", in_process: bool = False,
+         rows_in_flight: int = 256, paraphraser_deadline: Optional[float] = None,
+         ai_detector_deadline: Optional[float] = None, max_crashes: int = 3):
     # Pretend the file pointed to by load_data_file is a module and load it
     print("Loading the load_data function")
     load_data_filepath = pathlib.Path(load_data_filename).resolve()
@@ -103,158 +1073,96 @@ def main(load_data_filename: str,
     print("Loading the data")
     data = load_data()
 
-    # Where all the data is stored
-    # Think of this like a table in a database where the keys are the column names
-    combined_data = {
-        # The original texts, both human and AI, from the given dataset
-        "original_text": [],
-        # A boolean value stating of the corresponding text is AI generated
-        "is_ai": [],
-        # The paraphrased version of the original text.
-        "paraphrased_text": [],
-        # The detection rate of the original text according to the AI text detector
-        "original_detection": [],
-        # The detection rate of the paraphrased text according to the AI text detector
-        "paraphrased_detection": []
-    }
-
-    # Processing the given data to fit in this combined_data dictionary
-    combined_data["original_text"].extend(data["human"])
-    combined_data["original_text"].extend(data["machine"])
-    combined_data["is_ai"].extend([False for _ in range(len(data["human"]))])
-    combined_data["is_ai"].extend([True for _ in range(len(data["machine"]))])
-
-    # We no longer need the original data
-    del data
-
-    # Fill the other entries with default values
-    combined_data["paraphrased_text"].extend([None for _ in range(len(combined_data["original_text"]))])
-    combined_data["original_detection"].extend([None for _ in range(len(combined_data["original_text"]))])
-    combined_data["paraphrased_detection"].extend([None for _ in range(len(combined_data["original_text"]))])
-
-    # Creating a socket that the helpers can connect to for communication
-    print("Crating the socket")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.bind(("localhost", 8080))
-    sock.listen()
-
-    # Starting the paraphraser helper
-    print("Starting the paraphraser helper")
-    command = f"conda run -n {paraphraser_conda_env} python {paraphraser_file}"
-    process = start_process(command)
-
-    # Accepting the connection to the paraphraser helper
-    print("Accepting the paraphraser connection")
-    sock.settimeout(timeout_when_accepting_connections)
-    try:
-        paraphraser_sock, _paraphraser_address = sock.accept()
-    except socket.timeout:
-        print("Timed out when attempting to accept the paraphraser connection request")
-        print("Either the paraphraser took too long to start or crashed")
-        return
-    sock.settimeout(None)
-
-    # Communication time
-
-    progress = MyBar(f"Paraphrasing", max=len(combined_data["original_text"]))
-
-    # Sending strings and receiving the results from the paraphraser
-    for i, string in enumerate(combined_data["original_text"]):
-        # Sending the string
-        bytes_to_send = ServerMessages.DATA.create_message(string)
-        paraphraser_sock.sendall(bytes_to_send)
-
-        # Receiving the paraphrased string
-        indicator = ParaphraserMessages.read_indicator_from(paraphraser_sock)
-        paraphrase_result = indicator.read_rest_of_message_from(paraphraser_sock)
-
-        # Store it
-        combined_data["paraphrased_text"][i] = paraphrase_result.data
-
-        # Update the progress bar
-        progress.next()
-
-    # Done with the progress bar
-    progress.finish()
-
-    # Finally tell the paraphraser to finish
-    print("Tell the paraphraser to finish")
-    bytes_to_send = ServerMessages.FINISH.create_message()
-    paraphraser_sock.sendall(bytes_to_send)
-
-    # Wait for the paraphraser to terminate
-    print("Waiting for the paraphraser to terminate")
-    process.wait()
-    # Close the socket
-    paraphraser_sock.close()
-
-    # Starting the AI detector helper
-    print("Starting the AI detector helper")
-    command = f"conda run -n {ai_detector_conda_env} python {ai_detector_file}"
-    process = start_process(command)
-
-    # Accepting the connection to the AI detector helper
-    print("Accepting the AI detector connection")
-    sock.settimeout(timeout_when_accepting_connections)
+    if isinstance(data, dict):
+        # Where all the data is stored
+        # Think of this like a table in a database where the columns are the original texts, whether they are AI
+        #  generated, their paraphrased versions and the detection rates of both according to the AI text detector
+        combined_data = ResultStore(len(data["human"]) + len(data["machine"]))
+
+        # Processing the given data to fit in the columns, with every result starting as missing
+        for i, text in enumerate(data["human"]):
+            combined_data.set("original_text", i, text)
+        for i, text in enumerate(data["machine"], start=len(data["human"])):
+            combined_data.set("original_text", i, text)
+            combined_data.set("is_ai", i, True)
+
+        # We no longer need the original data
+        del data
+
+        records = None
+    else:
+        # An iterator of (text, is_ai) records, which are sent to the helpers as they are read instead of being held
+        combined_data = None
+        records = data
+
+    # Where the results are saved
+    if resume_path is None:
+        save_path = create_save_directory()
+    else:
+        save_path = pathlib.Path(resume_path).resolve()
+        if not save_path.is_dir():
+            print(f"No save directory found at {save_path}")
+            return
+
+    # Each row is written out as soon as it is finished, and the results of the combined data are journaled as they
+    #  arrive as well
+    writer = ResultWriter(save_path, resume=resume_path is not None)
+    print(f"Writing results to {writer.rows_path} as each row finishes")
+
+    journal = None
+    if combined_data is not None:
+        journal = RunJournal(save_path)
+        if resume_path is not None:
+            replayed = journal.replay(combined_data)
+            print(f"Resuming with {replayed} result(s) from the journal")
+        print(f"Journaling results to {journal.path}")
+
+    # Results from earlier runs
+    cache = None
+    if cache_path is not None:
+        cache = ResultCache(pathlib.Path(cache_path), cache_max_size_mb * 1024 * 1024)
+
+    # Running everything through the helpers
+    finished = False
     try:
-        ai_detector_sock, _ai_detector_address = sock.accept()
-    except socket.timeout:
-        print("Timed out when attempting to accept the AI detector connection request")
-        print("Either the AI detector took too long to start or crashed")
+        if combined_data is not None:
+            finished = asyncio.run(run_helpers(combined_data, journal, writer, cache,
+                                               paraphraser_file, paraphraser_conda_env,
+                                               ai_detector_file, ai_detector_conda_env,
+                                               timeout_when_accepting_connections, request_window_size, batch_size,
+                                               paraphraser_workers, ai_detector_workers, streaming, deduplicate,
+                                               paraphraser_addresses or [], ai_detector_addresses or [], transport,
+                                               in_process, paraphraser_deadline, ai_detector_deadline,
+                                               max_crashes))
+        else:
+            finished = asyncio.run(run_helpers_on_records(records, writer, cache,
+                                                          paraphraser_file, paraphraser_conda_env,
+                                                          ai_detector_file, ai_detector_conda_env,
+                                                          timeout_when_accepting_connections, request_window_size,
+                                                          batch_size, paraphraser_workers, ai_detector_workers,
+                                                          deduplicate, paraphraser_addresses or [],
+                                                          ai_detector_addresses or [], transport, in_process,
+                                                          rows_in_flight, paraphraser_deadline, ai_detector_deadline,
+                                                          max_crashes))
+    finally:
+        writer.close()
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+
+        # Whether the run crashed, was interrupted or a helper could not be started
+        if not finished:
+            print(f"Run again with `--resume \"{save_path}\"` to continue from the results so far")
+
+    if not finished:
         return
-    sock.settimeout(None)
-
-    # Communication time
-
-    progress = MyBar(f"Calculating AI percentages", max=len(combined_data["original_text"]))
-
-    # Sending strings and receiving the results from the AI detector
-    for i, (original_text, paraphrased_text) in \
-            enumerate(zip(combined_data["original_text"], combined_data["paraphrased_text"])):
-        # Send the original text
-        bytes_to_send = ServerMessages.DATA.create_message(original_text)
-        ai_detector_sock.sendall(bytes_to_send)
-
-        # Receiving the result
-        indicator = AIDetectorMessages.read_indicator_from(ai_detector_sock)
-        ai_detector_result = indicator.read_rest_of_message_from(ai_detector_sock)
-
-        # Store the result
-        combined_data["original_detection"][i] = ai_detector_result.data
-
-        # Send the paraphrased text
-        bytes_to_send = ServerMessages.DATA.create_message(paraphrased_text)
-        ai_detector_sock.sendall(bytes_to_send)
-
-        # Receiving the result
-        indicator = AIDetectorMessages.read_indicator_from(ai_detector_sock)
-        ai_detector_result = indicator.read_rest_of_message_from(ai_detector_sock)
-
-        # Store the result
-        combined_data["paraphrased_detection"][i] = ai_detector_result.data
-
-        # Update the progress bar
-        progress.next()
-
-    # Done with the progress bar
-    progress.finish()
-
-    # Finally tell the AI detector to finish
-    print("Tell the AI detector to finish")
-    bytes_to_send = ServerMessages.FINISH.create_message()
-    ai_detector_sock.sendall(bytes_to_send)
-
-    # Wait for the paraphraser to terminate
-    print("Waiting for the AI detector to terminate")
-    process.wait()
-    # Close the socket
-    ai_detector_sock.close()
 
     # Saving everything
-    create_save(load_data_filename,
+    create_save(save_path, load_data_filename,
                 paraphraser_file, paraphraser_conda_env,
                 ai_detector_file, ai_detector_conda_env,
-                combined_data)
+                writer)
 
     print("All done")
 
@@ -304,15 +1212,180 @@ if __name__ == '__main__':
 
     parser.add_argument(
         "--timeout-when-accepting-connections",
-        default=5,
+        default=None,
         type=int,
-        help="The maximum amount of time the main handler will wait when accepting helper connections.",
+        help="The maximum amount of time the main handler will wait for each kind of helper to be ready. "
+             "By default it waits for as long as the helpers are running.",
         dest="timeout_when_accepting_connections",
     )
 
+    parser.add_argument(
+        "--request-window",
+        default=8,
+        type=int,
+        help="The maximum number of requests that can be sent to a helper before its first answer is received.",
+        dest="request_window",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        default=1,
+        type=int,
+        help="The number of texts sent to a helper in one message, so helpers with a batch function can process them "
+             "together.",
+        dest="batch_size",
+    )
+
+    parser.add_argument(
+        "--paraphraser-workers",
+        default=1,
+        type=int,
+        help="The number of paraphraser helpers to start, each given work as soon as it is free.",
+        dest="paraphraser_workers",
+    )
+    parser.add_argument(
+        "--ai-detector-workers",
+        default=1,
+        type=int,
+        help="The number of AI detector helpers to start, each given work as soon as it is free.",
+        dest="ai_detector_workers",
+    )
+
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Run the paraphrasers and AI detectors at the same time, sending each paraphrased text to the AI "
+             "detectors as soon as it arrives.",
+        dest="streaming",
+    )
+
+    parser.add_argument(
+        "--resume",
+        default=None,
+        type=str,
+        help="The save directory of a run that stopped early. "
+             "The results in its journal are reused and only the missing ones are sent to the helpers.",
+        dest="resume_path",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default="cache",
+        type=str,
+        help="The directory of the cache of helper results shared between runs.",
+        dest="cache_path",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        default=1024,
+        type=int,
+        help="The maximum size of the cache in megabytes, after which the least recently used results are evicted.",
+        dest="cache_max_size_mb",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_const",
+        const=None,
+        help="Send every text to the helpers instead of using or filling the cache.",
+        dest="cache_path",
+    )
+
+    parser.add_argument(
+        "--no-deduplication",
+        action="store_false",
+        help="Send every text to the helpers, even if the same text has already been sent.",
+        dest="deduplicate",
+    )
+
+    parser.add_argument(
+        "--attach-paraphraser",
+        action="append",
+        type=str,
+        help="The host:port or unix:path of a paraphraser helper already running as a daemon, used instead of "
+             "starting one. Can be given more than once to use several.",
+        dest="paraphraser_addresses",
+    )
+    parser.add_argument(
+        "--attach-ai-detector",
+        action="append",
+        type=str,
+        help="The host:port or unix:path of an AI detector helper already running as a daemon, used instead of "
+             "starting one. Can be given more than once to use several.",
+        dest="ai_detector_addresses",
+    )
+
+    parser.add_argument(
+        "--transport",
+        default="tcp",
+        choices=Endpoint.TRANSPORTS,
+        help="How the helpers started for this run connect to the main handler. "
+             "Each run gets its own free TCP port or its own unix domain socket, so several runs can share a machine.",
+        dest="transport",
+    )
+
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Load the helper files into the main handler and call their functions directly, rather than starting "
+             "them in their own conda environments. Only for helpers that can run in the main handler's environment.",
+        dest="in_process",
+    )
+
+    parser.add_argument(
+        "--rows-in-flight",
+        default=256,
+        type=int,
+        help="The maximum number of rows being worked on at once when `load_data` gives an iterator of records, which "
+             "bounds the memory used however many records there are.",
+        dest="rows_in_flight",
+    )
+
+    parser.add_argument(
+        "--paraphraser-deadline",
+        default=None,
+        type=float,
+        help="The number of seconds a paraphraser request can go unanswered before a copy is sent to an idle "
+             "paraphraser, keeping whichever answer arrives first. By default copies are never sent.",
+        dest="paraphraser_deadline",
+    )
+    parser.add_argument(
+        "--ai-detector-deadline",
+        default=None,
+        type=float,
+        help="The number of seconds an AI detector request can go unanswered before a copy is sent to an idle AI "
+             "detector, keeping whichever answer arrives first. By default copies are never sent.",
+        dest="ai_detector_deadline",
+    )
+
+    parser.add_argument(
+        "--max-crashes",
+        default=3,
+        type=int,
+        help="The number of helper crashes a text can be in flight for before it is given up on and left missing. "
+             "Helpers that crash are restarted and the texts they had not answered are sent again.",
+        dest="max_crashes",
+    )
+
     args = parser.parse_args()
 
     main(args.load_data_file,
          args.paraphraser_file, args.paraphraser_conda_env,
          args.ai_detector_file, args.ai_detector_conda_env,
-         timeout_when_accepting_connections=args.timeout_when_accepting_connections)
+         timeout_when_accepting_connections=args.timeout_when_accepting_connections,
+         request_window_size=args.request_window,
+         batch_size=args.batch_size,
+         paraphraser_workers=args.paraphraser_workers,
+         ai_detector_workers=args.ai_detector_workers,
+         streaming=args.streaming,
+         resume_path=args.resume_path,
+         cache_path=args.cache_path,
+         cache_max_size_mb=args.cache_max_size_mb,
+         deduplicate=args.deduplicate,
+         paraphraser_addresses=args.paraphraser_addresses,
+         ai_detector_addresses=args.ai_detector_addresses,
+         transport=args.transport,
+         in_process=args.in_process,
+         rows_in_flight=args.rows_in_flight,
+         paraphraser_deadline=args.paraphraser_deadline,
+         ai_detector_deadline=args.ai_detector_deadline,
+         max_crashes=args.max_crashes)
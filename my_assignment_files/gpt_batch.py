@@ -0,0 +1,250 @@
+import ast
+import hashlib
+import importlib.util
+import json
+import pathlib
+import sys
+import time
+
+from result_cache import ResultCache
+
+# The OpenAI batch API takes at most this many requests in one file
+MAX_REQUESTS_PER_FILE = 50_000
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+def read_paraphraser_constants(paraphraser_file):
+    # The paraphraser is not imported, as that would start its server and it needs its own conda environment
+    # Reading the values from the file instead means the batch always asks for exactly what the paraphraser would
+    constants = {}
+    for node in ast.parse(pathlib.Path(paraphraser_file).read_text(encoding="UTF-8")).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and \
+                node.targets[0].id in ("MODEL", "ROLE"):
+            constants[node.targets[0].id] = ast.literal_eval(node.value)
+
+    return constants["MODEL"], constants["ROLE"]
+
+
+def custom_id_for(text):
+    # The same text always has the same ID, so a text only needs to be asked for once
+    return hashlib.sha256(text.encode("UTF-8")).hexdigest()
+
+
+def load_texts(load_data_filename):
+    # Loaded the same way as in main.py
+    load_data_filepath = pathlib.Path(load_data_filename).resolve()
+    module_name = load_data_filepath.stem
+    spec = importlib.util.spec_from_file_location(module_name, load_data_filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    data = module.load_data()
+
+    # Either the human and machine lists or an iterator of (text, is_ai) records
+    if isinstance(data, dict):
+        yield from data["human"]
+        yield from data["machine"]
+    else:
+        for text, _is_ai in data:
+            yield text
+
+
+def batch_input_paths(batch_input_path, file_count):
+    if file_count <= 1:
+        return [batch_input_path]
+
+    return [batch_input_path.with_name(f"{batch_input_path.stem}_{i}{batch_input_path.suffix}")
+            for i in range(1, file_count + 1)]
+
+
+def write_batch(batch_input_path, load_data_filename, paraphraser_file, paraphraser_conda_env, cache_path,
+                cache_max_size_mb):
+    """
+    Writes a request in the OpenAI batch input format for every text that does not have a paraphrase in the cache.
+    More than one file is written if there are too many requests for one, numbered from 1.
+
+    :return: The paths of the files written.
+    """
+
+    model, role = read_paraphraser_constants(paraphraser_file)
+    paraphraser_key = ResultCache.helper_key(paraphraser_file, paraphraser_conda_env)
+    cache = ResultCache(pathlib.Path(cache_path), cache_max_size_mb * 1024 * 1024)
+
+    requests = []
+    custom_ids = set()
+    already_cached = 0
+    try:
+        for text in load_texts(load_data_filename):
+            custom_id = custom_id_for(text)
+            if custom_id in custom_ids:
+                continue
+            if cache.get(paraphraser_key, text) is not None:
+                already_cached += 1
+                continue
+
+            custom_ids.add(custom_id)
+            requests.append({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_URL,
+                "body": {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": role},
+                        {"role": "user", "content": text}
+                    ]
+                }
+            })
+    finally:
+        cache.close()
+
+    file_count = max(1, -(-len(requests) // MAX_REQUESTS_PER_FILE))
+    paths = batch_input_paths(batch_input_path, file_count)
+    for i, path in enumerate(paths):
+        with open(path, "w", encoding="UTF-8") as f:
+            for request in requests[i * MAX_REQUESTS_PER_FILE:(i + 1) * MAX_REQUESTS_PER_FILE]:
+                f.write(json.dumps(request) + "\n")
+
+    print(f"Wrote {len(requests)} request(s) to {', '.join(str(path) for path in paths)}, "
+          f"{already_cached} text(s) already have a paraphrase in the cache")
+
+    return paths
+
+
+def fake_batch(batch_input_path, batch_output_path):
+    """
+    Processes a batch input file locally, writing a batch output file in the same format as the OpenAI batch API.
+    Each text is paraphrased the same way as in example_paraphraser.py, for testing without sending anything to OpenAI.
+    """
+
+    with open(batch_input_path, "r", encoding="UTF-8") as input_file, \
+            open(batch_output_path, "w", encoding="UTF-8") as output_file:
+        for i, line in enumerate(input_file):
+            request = json.loads(line)
+            text = request["body"]["messages"][-1]["content"]
+
+            response_body = {
+                "id": f"chatcmpl-fake-{i}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["body"]["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "paraphrase(" + text + ")"},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            }
+            result = {
+                "id": f"batch_req_fake_{i}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"fake-{i}", "body": response_body},
+                "error": None
+            }
+            output_file.write(json.dumps(result) + "\n")
+
+
+def ingest_batch(batch_input_paths_, batch_output_paths, paraphraser_file, paraphraser_conda_env, cache_path,
+                 cache_max_size_mb):
+    """
+    Reads batch output files back in, putting each paraphrase in the cache as if the paraphraser had returned it.
+    The paraphrases are matched to their texts by the custom ID of the requests in the batch input files.
+    A run of main.py with the same paraphraser then takes the paraphrases from the cache instead of asking for them.
+    Failed requests are left out, so the text is written to the next batch.
+    This includes requests the API rejected as bad, which main.py sends to gpt_paraphraser.py instead of taking an
+     empty paraphrase from the cache, so the error is recorded for the row.
+    """
+
+    texts_by_custom_id = {}
+    for batch_input_path in batch_input_paths_:
+        with open(batch_input_path, "r", encoding="UTF-8") as f:
+            for line in f:
+                request = json.loads(line)
+                texts_by_custom_id[request["custom_id"]] = request["body"]["messages"][-1]["content"]
+
+    paraphraser_key = ResultCache.helper_key(paraphraser_file, paraphraser_conda_env)
+    cache = ResultCache(pathlib.Path(cache_path), cache_max_size_mb * 1024 * 1024)
+
+    ingested = 0
+    bad_requests = 0
+    failed = 0
+    unknown = 0
+    try:
+        for batch_output_path in batch_output_paths:
+            with open(batch_output_path, "r", encoding="UTF-8") as f:
+                for line in f:
+                    result = json.loads(line)
+
+                    text = texts_by_custom_id.get(result["custom_id"])
+                    if text is None:
+                        unknown += 1
+                        continue
+
+                    response = result.get("response")
+                    if response is not None and response["status_code"] == 200:
+                        cache.put(paraphraser_key, text, response["body"]["choices"][0]["message"]["content"])
+                        ingested += 1
+                    elif response is not None and response["status_code"] == 400:
+                        bad_requests += 1
+                    else:
+                        failed += 1
+    finally:
+        cache.close()
+
+    print(f"Ingested {ingested} paraphrase(s) into the cache, {bad_requests} were bad request(s), "
+          f"{failed} failed and {unknown} had an unknown custom ID")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Paraphrase with the OpenAI batch API instead of a request per text. "
+                    "`write` the requests, submit them as a batch, then `ingest` the output before running main.py."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    write_parser = subparsers.add_parser("write", help="Write the batch input file.")
+    write_parser.add_argument("batch_input", type=str, help="The batch input file to write.")
+    write_parser.add_argument("-ldf", "--load-data-file", default="load_data.py", type=str,
+                              help="The python file containing a function called `load_data`.",
+                              dest="load_data_file")
+
+    fake_parser = subparsers.add_parser("fake", help="Process a batch input file locally, for testing.")
+    fake_parser.add_argument("batch_input", type=str, help="The batch input file to process.")
+    fake_parser.add_argument("batch_output", type=str, help="The batch output file to write.")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Put the paraphrases from batch output files in the cache.")
+    ingest_parser.add_argument("--batch-input", action="append", required=True, type=str,
+                               help="A batch input file the output is for, given once for each file.",
+                               dest="batch_inputs")
+    ingest_parser.add_argument("--batch-output", action="append", required=True, type=str,
+                               help="A batch output file to ingest, given once for each file.",
+                               dest="batch_outputs")
+
+    for subparser in (write_parser, ingest_parser):
+        subparser.add_argument("-pf", "--paraphraser-file", default="gpt_paraphraser.py", type=str,
+                               help="The paraphraser file main.py is given, which the requests are made for.",
+                               dest="paraphraser_file")
+        subparser.add_argument("-pce", "--paraphraser-conda-env", default="gpt_env", type=str,
+                               help="The conda environment main.py is given for the paraphraser.",
+                               dest="paraphraser_conda_env")
+        subparser.add_argument("--cache-dir", default="cache", type=str,
+                               help="The directory of the cache of helper results shared between runs.",
+                               dest="cache_path")
+        subparser.add_argument("--cache-max-size", default=1024, type=int,
+                               help="The maximum size of the cache in megabytes.",
+                               dest="cache_max_size_mb")
+
+    args = parser.parse_args()
+
+    if args.command == "write":
+        write_batch(pathlib.Path(args.batch_input), args.load_data_file, args.paraphraser_file,
+                    args.paraphraser_conda_env, args.cache_path, args.cache_max_size_mb)
+    elif args.command == "fake":
+        fake_batch(args.batch_input, args.batch_output)
+    else:
+        ingest_batch(args.batch_inputs, args.batch_outputs, args.paraphraser_file, args.paraphraser_conda_env,
+                     args.cache_path, args.cache_max_size_mb)
@@ -1,16 +1,43 @@
+import asyncio
+import atexit
+import collections
+import os
 import pathlib
+import random
+import time
 
 import openai
-from openai import OpenAI
+import tiktoken
+from openai import AsyncOpenAI
 
-from paraphraser_helpers import paraphraser_server
+from communication import HelperError
+from paraphraser_helpers import async_paraphraser_server
 
 MODEL = "gpt-3.5-turbo"
 
+# The maximum number of requests to OpenAI at once
+CONCURRENCY_LIMIT = 8
+
+# The budget to stay within, which should be at or just under the account's rate limits for the model
+REQUESTS_PER_MINUTE = 3500
+TOKENS_PER_MINUTE = 60000
+
+# How many times a request is retried after a rate limit or transient error, and the backoff in seconds between tries
+MAX_RETRIES = 6
+INITIAL_BACKOFF = 1
+MAX_BACKOFF = 60
+
+# Where the requests are sent, which can be pointed at a local stand-in for the API
+# None uses the OpenAI API
+BASE_URL = os.environ.get("OPENAI_BASE_URL")
+
 with open(pathlib.Path("my_assignment_files/api_key.txt"), "r") as f:
     api_key = f.read().strip()
 
-CLIENT = OpenAI(api_key=api_key)
+# Retrying is done here instead, so it can follow the budget
+CLIENT = AsyncOpenAI(api_key=api_key, base_url=BASE_URL, max_retries=0)
+
+ENCODING = tiktoken.encoding_for_model(MODEL)
 
 ROLE = ("When it comes to writing content, two factors are crucial, 'perplexity' and 'burstiness'. "
         "Perplexity measures the complexity of text. "
@@ -22,20 +49,239 @@ ROLE = ("When it comes to writing content, two factors are crucial, 'perplexity'
         "amount of perplexity and burstiness. "
         "Rewrite this article with a high degree of perplexity and burstiness.")
 
+# Each message costs a few tokens on top of its content, and the reply a few more
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+def count_tokens(text):
+    return len(ENCODING.encode(text, disallowed_special=()))
+
+
+ROLE_TOKENS = count_tokens(ROLE)
+
+
+def estimate_tokens(text):
+    # The prompt is counted exactly, while the paraphrase is assumed to be about as long as the text
+    text_tokens = count_tokens(text)
+    return ROLE_TOKENS + text_tokens + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY + text_tokens
+
+
+class TokenBudget:
+    """
+    Keeps the requests sent within a requests per minute and a tokens per minute budget.
+
+    Each budget is a bucket refilled continuously, holding at most a second's worth, so requests are spread out evenly
+     rather than sent in bursts the API would reject.
+    A request takes what it needs from both buckets straight away, going into debt if there is not enough, then waits
+     until the debt is paid off, so requests are let through in the order they arrive.
+    As the tokens a request uses are only known once it is answered, it takes an estimate which is settled afterwards.
+
+    Once the API says the rate limit has been reached, the buckets are emptied and stop refilling until the pause has
+     passed, so the requests waiting do not all fail the same way.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float) -> None:
+        """
+        :param requests_per_minute: The maximum number of requests to send in a minute.
+        :param tokens_per_minute: The maximum number of tokens to use in a minute.
+        """
+
+        self.requests_per_minute: float = requests_per_minute
+        """The maximum number of requests to send in a minute."""
+
+        self.tokens_per_minute: float = tokens_per_minute
+        """The maximum number of tokens to use in a minute."""
+
+        self.requests: int = 0
+        """The number of requests sent, including retries."""
+
+        self.tokens: int = 0
+        """The number of tokens used, as reported by the API."""
+
+        self.retries: int = 0
+        """The number of requests retried after an error."""
+
+        self.rate_limited: int = 0
+        """The number of requests rejected by the API for reaching the rate limit."""
+
+        self.peak_requests_per_minute: int = 0
+        """The most requests sent within any minute."""
+
+        self.peak_tokens_per_minute: int = 0
+        """The most tokens used within any minute."""
+
+        self._request_rate = requests_per_minute / 60
+        self._token_rate = tokens_per_minute / 60
+        self._request_capacity = max(1.0, self._request_rate)
+        self._token_capacity = self._token_rate
+        self._request_level = self._request_capacity
+        self._token_level = self._token_capacity
+        # In the future while paused, so the buckets do not refill until then
+        self._last_refill = time.monotonic()
+
+        self._started = time.monotonic()
+        self._recent_requests = collections.deque()
+        self._recent_tokens = collections.deque()
+        self._recent_token_total = 0
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Waits until a request of an estimated number of tokens can be sent within the budget.
+
+        :param tokens: The estimated number of tokens the request uses, to be settled once it is answered.
+        """
+
+        now = time.monotonic()
+        self._refill(now)
+
+        self._request_level -= 1
+        self._token_level -= tokens
+
+        # The time the debt in both buckets is paid off, from when they next refill
+        debt_seconds = max(-self._request_level / self._request_rate, -self._token_level / self._token_rate, 0)
+        wait = self._last_refill + debt_seconds - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        self._record_request(time.monotonic())
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Corrects the estimate taken by `acquire` once the number of tokens used is known.
+
+        :param estimated_tokens: The estimate given to `acquire`.
+        :param used_tokens: The number of tokens actually used, which is 0 if the request failed.
+        """
+
+        self._token_level = min(self._token_level + estimated_tokens - used_tokens, self._token_capacity)
+        self._record_tokens(time.monotonic(), used_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Lets no more requests through until some time has passed, after the API said the rate limit was reached.
+
+        :param seconds: How long to pause for.
+        """
+
+        self.rate_limited += 1
+
+        self._refill(time.monotonic())
+        self._request_level = min(self._request_level, 0)
+        self._token_level = min(self._token_level, 0)
+        self._last_refill = max(self._last_refill, time.monotonic() + seconds)
+
+    def report(self) -> str:
+        """
+        :return: A summary of what was sent and how close it came to the budget.
+        """
+
+        elapsed = time.monotonic() - self._started
+
+        return (f"Rate limit budget - {self.requests} request(s) using {self.tokens} token(s) in {elapsed:.0f}s, "
+                f"{self.retries} retried and {self.rate_limited} rate limited\n"
+                f"Peak use of the budget - "
+                f"{self.peak_requests_per_minute}/{self.requests_per_minute:.0f} requests per minute "
+                f"({100 * self.peak_requests_per_minute / self.requests_per_minute:.0f}%), "
+                f"{self.peak_tokens_per_minute}/{self.tokens_per_minute:.0f} tokens per minute "
+                f"({100 * self.peak_tokens_per_minute / self.tokens_per_minute:.0f}%)")
+
+    def _refill(self, now: float) -> None:
+        if now <= self._last_refill:
+            return
+
+        elapsed = now - self._last_refill
+        self._request_level = min(self._request_level + elapsed * self._request_rate, self._request_capacity)
+        self._token_level = min(self._token_level + elapsed * self._token_rate, self._token_capacity)
+        self._last_refill = now
+
+    def _record_request(self, now: float) -> None:
+        self.requests += 1
+
+        self._recent_requests.append(now)
+        while self._recent_requests[0] <= now - 60:
+            self._recent_requests.popleft()
+        self.peak_requests_per_minute = max(self.peak_requests_per_minute, len(self._recent_requests))
+
+    def _record_tokens(self, now: float, tokens: int) -> None:
+        self.tokens += tokens
+
+        self._recent_tokens.append((now, tokens))
+        self._recent_token_total += tokens
+        while self._recent_tokens[0][0] <= now - 60:
+            self._recent_token_total -= self._recent_tokens.popleft()[1]
+        self.peak_tokens_per_minute = max(self.peak_tokens_per_minute, self._recent_token_total)
+
+
+BUDGET = TokenBudget(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+# Reported however the helper ends
+atexit.register(lambda: print(BUDGET.report()))
+
+
+def backoff(attempt, error):
+    # The API may say how long to wait, otherwise the backoff doubles with each try and is spread out randomly so the
+    #  requests that failed together do not all try again together
+    if isinstance(error, openai.APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after) + random.uniform(0, INITIAL_BACKOFF)
+            except ValueError:
+                pass
+
+    return random.uniform(0, min(MAX_BACKOFF, INITIAL_BACKOFF * 2 ** attempt))
+
+
+def retry_error_code(error):
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection_error"
+
+    return "server_error"
+
+
+async def paraphrase_with_gpt(text):
+    estimated_tokens = estimate_tokens(text)
+
+    for attempt in range(MAX_RETRIES + 1):
+        await BUDGET.acquire(estimated_tokens)
+
+        try:
+            response = await CLIENT.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": ROLE},
+                    {"role": "user", "content": text}
+                ]
+            )
+        except openai.BadRequestError as e:
+            BUDGET.settle(estimated_tokens, 0)
+
+            # Such as the text being too long, which trying again will not help, so the handler server is told why
+            raise HelperError(e.code or "bad_request", e.message)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            BUDGET.settle(estimated_tokens, 0)
+
+            # Raising anything else would end the helper, losing the budget, and have its texts sent to it again
+            # Running out of credit is reported as a rate limit, but trying again will not help
+            if getattr(e, "code", None) == "insufficient_quota":
+                raise HelperError("insufficient_quota", e.message)
+            if attempt == MAX_RETRIES:
+                raise HelperError(retry_error_code(e), f"Gave up after {MAX_RETRIES} retries - {e}")
+
+            BUDGET.retries += 1
+            if isinstance(e, openai.RateLimitError):
+                BUDGET.pause(backoff(attempt, e))
+            else:
+                await asyncio.sleep(backoff(attempt, e))
+            continue
 
-def paraphrase_with_gpt(text):
-    try:
-        response = CLIENT.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": ROLE},
-                {"role": "user", "content": text}
-            ]
-        )
-    except openai.BadRequestError:
-        return ""
+        used_tokens = response.usage.total_tokens if response.usage is not None else estimated_tokens
+        BUDGET.settle(estimated_tokens, used_tokens)
 
-    return response.choices[0].message.content
+        return response.choices[0].message.content
 
 
-paraphraser_server(paraphrase_with_gpt)
+async_paraphraser_server(paraphrase_with_gpt, concurrency_limit=CONCURRENCY_LIMIT)
@@ -1,5 +1,9 @@
+import json
+import mmap
 import pathlib
+from typing import Dict, List
 
+import numpy as np
 import pandas as pd
 import tiktoken
 
@@ -10,66 +14,147 @@ MODEL = "gpt-3.5-turbo"
 # Divide this by 2 to get the maximum for human and machine separately
 MAX_DATA = 1000
 
+# Texts with more tokens than this are skipped
+MAX_TOKENS = 16000
 
-def load_data(logging: bool = False):
-    data = {
-        "human": [],
-        "machine": []
-    }
+DATA_PATH = pathlib.Path("my_assignment_files/data/data.csv")
 
-    human_max = MAX_DATA // 2
-    human_num = 0
-    machine_max = MAX_DATA // 2
-    machine_num = 0
+# Where the preprocessed form of the data is kept
+PREPROCESSED_PATH = DATA_PATH.parent / "preprocessed"
+TEXTS_PATH = PREPROCESSED_PATH / "texts.bin"
+OFFSETS_PATH = PREPROCESSED_PATH / "offsets.npy"
+IS_HUMAN_PATH = PREPROCESSED_PATH / "is_human.npy"
+TOKEN_COUNTS_PATH = PREPROCESSED_PATH / "token_counts.npy"
+# Written last, so an interrupted preprocessing is never mistaken for a finished one
+META_PATH = PREPROCESSED_PATH / "meta.json"
 
-    skipped_rows_numbers = []
-    encoding = tiktoken.encoding_for_model(MODEL)
+# The token count given to rows without any text, so they are never chosen
+NO_TEXT = np.iinfo(np.int32).max
 
-    df = pd.read_csv(pathlib.Path("my_assignment_files/data/data.csv"))
-    df = df.sample(frac=1, random_state=1).reset_index(drop=True)
+# The number of rows read from the file at once, so the whole file is never in memory
+CHUNK_SIZE = 100_000
 
-    for index, row in df.iterrows():
-        source = row["source"].strip().lower()
+# The number of threads used to count tokens
+TOKENIZER_THREADS = 8
+
+
+def data_file_meta() -> dict:
+    # What the preprocessed data was made from, to know when it is out of date
+    stat = DATA_PATH.stat()
+
+    return {"data_size": stat.st_size, "data_mtime_ns": stat.st_mtime_ns, "model": MODEL}
+
+
+def is_preprocessed() -> bool:
+    """
+    Checks whether the preprocessed data exists and was made from the current data file and model.
+    If the data file is gone the preprocessed data is used as it is.
+
+    :return: Whether the preprocessed data can be used.
+    """
+
+    if not META_PATH.exists():
+        return False
+
+    with open(META_PATH) as f:
+        meta = json.load(f)
+
+    if not DATA_PATH.exists():
+        return meta["model"] == MODEL
+
+    return meta == data_file_meta()
+
+
+def preprocess_data(logging: bool = False) -> None:
+    """
+    Reads the data file once and writes it out in a form that can be memory mapped.
+    The texts are stored one after another in a single UTF-8 file, with the offset of each text kept separately.
+    Whether each row is human and the number of tokens in each text are also stored, so nothing needs to be
+    parsed or tokenized to choose the rows.
+
+    :param logging: Whether to print the progress.
+    """
+
+    encoding = tiktoken.encoding_for_model(MODEL)
+
+    PREPROCESSED_PATH.mkdir(parents=True, exist_ok=True)
+    if META_PATH.exists():
+        META_PATH.unlink()
+
+    offsets = [np.zeros(1, dtype=np.int64)]
+    is_human = []
+    token_counts = []
+    texts_length = 0
+
+    with open(TEXTS_PATH, "wb") as texts_file:
+        for chunk in pd.read_csv(DATA_PATH, usecols=["text", "source"], chunksize=CHUNK_SIZE):
+            # Rows without any text are kept, so the row numbers still match the data file
+            has_text = chunk["text"].map(lambda text: isinstance(text, str)).to_numpy()
+            texts = [text if present else "" for text, present in zip(chunk["text"].tolist(), has_text)]
+
+            encoded_texts = [text.encode("UTF-8") for text in texts]
+            lengths = np.array([len(encoded_text) for encoded_text in encoded_texts], dtype=np.int64)
+            offsets.append(texts_length + np.cumsum(lengths))
+            texts_length += int(lengths.sum())
+            texts_file.write(b"".join(encoded_texts))
+
+            is_human.append((chunk["source"].str.strip().str.lower() == "human").to_numpy())
+
+            # Special tokens within the texts are counted as ordinary text
+            chunk_token_counts = np.array(
+                [len(tokens) for tokens in
+                 encoding.encode_batch(texts, num_threads=TOKENIZER_THREADS, disallowed_special=())],
+                dtype=np.int32
+            )
+            chunk_token_counts[~has_text] = NO_TEXT
+            token_counts.append(chunk_token_counts)
 
-        # Terminate if at max data
-        if human_num >= human_max and machine_num >= machine_max:
-            if logging:
-                print("Max number of human and machine data encountered")
-            break
-
-        # Skip if reached max amount
-        if source == "human":
-            if human_num >= human_max:
-                if logging:
-                    print(f"Skipped row {index} due to max number of human data encountered")
-                skipped_rows_numbers.append(index)
-                continue
-        else:
-            if machine_num >= machine_max:
-                if logging:
-                    print(f"Skipped row {index} due to max number of machine data encountered")
-                skipped_rows_numbers.append(index)
-                continue
-
-        text = row["text"]
-
-        # Skip if there is too many tokens
-        tokens = encoding.encode(text)
-        if len(tokens) > 16000:
             if logging:
-                print(f"Skipped row {index} due to too many tokens")
-            skipped_rows_numbers.append(index)
-            continue
+                print("Preprocessed", sum(len(part) for part in is_human), "rows")
+
+    np.save(OFFSETS_PATH, np.concatenate(offsets))
+    np.save(IS_HUMAN_PATH, np.concatenate(is_human))
+    np.save(TOKEN_COUNTS_PATH, np.concatenate(token_counts))
+
+    with open(META_PATH, "w") as f:
+        json.dump(data_file_meta(), f)
+
+
+def load_data(logging: bool = False):
+    if not is_preprocessed():
+        if logging:
+            print("Preprocessing", DATA_PATH)
+        preprocess_data(logging)
+
+    data: Dict[str, List[str]] = {}
+
+    quota = MAX_DATA // 2
+
+    offsets = np.load(OFFSETS_PATH, mmap_mode="r")
+    is_human = np.load(IS_HUMAN_PATH, mmap_mode="r")
+    token_counts = np.load(TOKEN_COUNTS_PATH, mmap_mode="r")
+    row_count = len(is_human)
+
+    # The same shuffle as df.sample(frac=1, random_state=1) on the whole file, so the same rows are chosen
+    shuffled_rows = np.random.RandomState(1).choice(row_count, size=row_count, replace=False)
+    shuffled_is_human = is_human[shuffled_rows]
+    shuffled_usable = token_counts[shuffled_rows] <= MAX_TOKENS
+
+    # Rows are taken in shuffled order, skipping those with too many tokens, until each source is at its maximum
+    too_many_tokens = 0
+    with open(TEXTS_PATH, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as texts:
+        for source, from_source in (("human", shuffled_is_human), ("machine", ~shuffled_is_human)):
+            chosen = np.flatnonzero(from_source & shuffled_usable)[:quota]
+
+            if len(chosen):
+                passed = slice(0, chosen[-1] + 1)
+                too_many_tokens += int(np.count_nonzero(from_source[passed] & ~shuffled_usable[passed]))
 
-        if source == "human":
-            human_num += 1
-            data["human"].append(text)
-        else:
-            machine_num += 1
-            data["machine"].append(text)
+            data[source] = [texts[offsets[row]:offsets[row + 1]].decode("UTF-8")
+                            for row in shuffled_rows[chosen].tolist()]
 
     if logging:
-        print("Skipped", len(skipped_rows_numbers))
+        print("Skipped", too_many_tokens, "due to too many tokens")
         print("Loaded", len(data["human"]) + len(data["machine"]), "total")
         print("\tHuman", len(data["human"]))
         print("\tMachine", len(data["machine"]))
@@ -79,6 +164,7 @@ def load_data(logging: bool = False):
 
 def main():
     # A way to test this function
+    # The data is preprocessed the first time, which takes a while for a large data file
     # A bunch of rows raise errors due to incorrect handling of the data
     # This appears to occur when there are newlines within the text field
     # For now at least I am ignoring the rows that are causing errors
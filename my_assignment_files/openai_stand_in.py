@@ -0,0 +1,160 @@
+import argparse
+import http.server
+import json
+import signal
+import sys
+import threading
+import time
+from typing import Optional
+
+# The usual number of tokens a message costs on top of its content, the same as gpt_paraphraser.py assumes
+TOKENS_PER_MESSAGE = 3
+
+
+class StandInState:
+    """
+    What the stand-in has been asked for so far, shared between the threads answering requests.
+    """
+
+    def __init__(self, rate_limit_first: int, retry_after: float, quota: Optional[int]) -> None:
+        """
+        :param rate_limit_first: The number of requests answered with a rate limit error before any are answered.
+        :param retry_after: The seconds given in the `retry-after` header of a rate limit error.
+        :param quota: The number of requests answered before running out of credit, or None to never run out.
+        """
+
+        self.rate_limit_first: int = rate_limit_first
+        self.retry_after: float = retry_after
+        self.quota: Optional[int] = quota
+
+        self.requests: int = 0
+        self.rate_limited: int = 0
+        self.answered: int = 0
+
+        self._lock = threading.Lock()
+
+    def take_response(self, body: dict):
+        """
+        :param body: The body of a chat completions request.
+        :return: The status code, extra headers and body to answer it with.
+        """
+
+        with self._lock:
+            self.requests += 1
+
+            if self.rate_limited < self.rate_limit_first:
+                self.rate_limited += 1
+                return 429, {"retry-after": str(self.retry_after)}, {"error": {
+                    "message": "Rate limit reached for requests",
+                    "type": "requests",
+                    "param": None,
+                    "code": "rate_limit_exceeded"
+                }}
+
+            if self.quota is not None and self.answered >= self.quota:
+                self.rate_limited += 1
+                return 429, {}, {"error": {
+                    "message": "You exceeded your current quota, please check your plan and billing details.",
+                    "type": "insufficient_quota",
+                    "param": None,
+                    "code": "insufficient_quota"
+                }}
+
+            self.answered += 1
+
+        text = body["messages"][-1]["content"]
+        prompt_tokens = sum(len(message["content"].split()) + TOKENS_PER_MESSAGE for message in body["messages"])
+        completion_tokens = len(text.split()) + 2
+
+        return 200, {}, {
+            "id": f"chatcmpl-stand-in-{self.answered}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "paraphrase(" + text + ")"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def report(self) -> str:
+        with self._lock:
+            return (f"Stand-in - {self.requests} request(s), {self.rate_limited} rate limited and {self.answered} "
+                    f"answered")
+
+
+def make_handler(state: StandInState):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, headers, response_body = state.take_response(body)
+
+            response_bytes = json.dumps(response_body).encode("UTF-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response_bytes)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(response_bytes)
+
+        def log_message(self, format, *args) -> None:
+            # Every request is counted instead of logged
+            pass
+
+    return Handler
+
+
+def serve(host, port, rate_limit_first, retry_after, quota):
+    """
+    Answers chat completions requests the way the OpenAI API would, paraphrasing the same way as
+     example_paraphraser.py, for trying out gpt_paraphraser.py without sending anything to OpenAI.
+    The first requests are answered with a rate limit error, so the retries, the backoff and the pausing of the budget
+     can be seen working before the rest are answered.
+    Given a quota, the credit runs out once that many requests have been answered, and every request after is
+     answered with an insufficient quota error.
+    How many requests were rate limited and answered is printed when it is stopped.
+    """
+
+    state = StandInState(rate_limit_first, retry_after, quota)
+    server = http.server.ThreadingHTTPServer((host, port), make_handler(state))
+
+    print(f"Standing in for the OpenAI API at http://{host}:{server.server_port}/v1")
+
+    # Stopped the same way however it is stopped, so the report is always printed
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(state.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="A local stand-in for the OpenAI chat completions API. "
+                    "Run gpt_paraphraser.py with OPENAI_BASE_URL set to the address it prints."
+    )
+    parser.add_argument("--host", default="localhost", type=str, help="The host to listen on.")
+    parser.add_argument("--port", default=8000, type=int, help="The port to listen on.")
+    parser.add_argument("--rate-limit-first", default=3, type=int,
+                        help="The number of requests answered with a 429 rate limit error before any are answered.",
+                        dest="rate_limit_first")
+    parser.add_argument("--retry-after", default=1, type=float,
+                        help="The seconds given in the retry-after header of a rate limit error.",
+                        dest="retry_after")
+    parser.add_argument("--quota", default=None, type=int,
+                        help="The number of requests answered before the credit runs out. Defaults to never.")
+
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.rate_limit_first, args.retry_after, args.quota)
@@ -5,19 +5,26 @@ import transformers
 from ai_detector_helpers import ai_detector_server
 
 DEVICE = "cpu"
+MAX_LENGTH = 512
 
 DETECTOR = transformers.AutoModelForSequenceClassification.from_pretrained("TrustSafeAI/RADAR-Vicuna-7B")
 TOKENIZER = transformers.AutoTokenizer.from_pretrained("TrustSafeAI/RADAR-Vicuna-7B")
 
 
-def calculate_percentage_change_ai(text):
+def calculate_percentages_change_ai(texts):
+    # The texts are run through the model together, padded to the longest one
     with torch.no_grad():
-        inputs = TOKENIZER(text, padding=True, truncation=True, max_length=512, return_tensors="pt")
+        inputs = TOKENIZER(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
         inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
 
-        output_probs = F.log_softmax(DETECTOR(**inputs).logits, -1)[:, 0].exp().tolist()[0]
+        output_probs = F.log_softmax(DETECTOR(**inputs).logits, -1)[:, 0].exp().tolist()
 
         return output_probs
 
 
-ai_detector_server(calculate_percentage_change_ai)
+def count_tokens(text):
+    # Texts are truncated, so every text longer than the maximum costs the same
+    return min(len(TOKENIZER(text).input_ids), MAX_LENGTH)
+
+
+ai_detector_server(batch_function=calculate_percentages_change_ai, max_batch_size=8, length_function=count_tokens)
@@ -1,10 +1,16 @@
-from typing import Callable
+import asyncio
+import socket
+from typing import Awaitable, Callable, List, Optional, Union
 
-from communication import ParaphraserMessages, ServerMessages, connect_to_server
+from communication import (Endpoint, FrameReader, HelperError, ParaphraserMessages, ServerMessages, address_from_argv,
+                           async_connect_to_server, async_serve_handlers_at, connect_to_server, serve_handlers_at)
+from in_process_helpers import capture_helper
 
 
-def paraphraser_server(paraphrase_function: Callable[[str], str],
-                       server_address: str = "localhost", server_port: int = 8080) -> None:
+def paraphraser_server(paraphrase_function: Optional[Callable[[str], str]] = None,
+                       server_address: str = "localhost", server_port: int = 8080,
+                       batch_function: Optional[Callable[[List[str]], List[str]]] = None,
+                       listen_address: Optional[str] = None) -> None:
     """
     A helper function for the paraphraser.
     Performs the task of receiving data from the server, paraphrasing it and sending the result back.
@@ -17,35 +23,280 @@ def paraphraser_server(paraphrase_function: Callable[[str], str],
 
     If the paraphrasing is not simple, then the flow of this helper can be seen in its implementation.
 
+    If a text cannot be paraphrased, such as one a web API rejects, the paraphrase function can raise a `HelperError`
+     saying why.
+    It is sent to the handler server in place of the paraphrase, and the helper carries on with the next text.
+    A batch function can raise one for the whole batch, or put one in its list in place of a single paraphrase.
+
+    If several texts can be paraphrased more efficiently together, a batch function can be passed instead, or as well.
+    It is used for batches of texts and the paraphrase function, if given, for single texts.
+
+    If the handler server is run with `--in-process`, it loads the helper file itself and this returns straight away,
+     leaving the handler server to call the functions directly.
+
+    Giving a listen address runs the helper as a daemon instead, which listens for handler servers to connect rather
+     than connecting to one, and serves one run after another without exiting.
+    The handler server attaches to it with `--attach-paraphraser`.
+
     :param paraphrase_function: A function that takes the original text and returns a paraphrased version.
-    :param server_address: The address of the handler server to connect to.
-    :param server_port: The port of the handler server to connect to.
+    :param server_address:
+        The address of the handler server to connect to, unless the handler server started this helper and gave its
+         endpoint after `--connect` on the command line.
+    :param server_port: The port of the handler server to connect to, unless given an endpoint in the same way.
+    :param batch_function:
+        A function that takes a list of original texts and returns a list of paraphrased versions in the same order.
+    :param listen_address:
+        The endpoint to listen on as a daemon, written as `host:port` or `unix:path`.
+        Defaults to the address after `--listen` on the command line, and if that is not given the helper is not run as
+         a daemon.
+    :raises ValueError: If neither a paraphrase function nor a batch function is given.
     """
 
-    # Connect to the handler server
-    sock = connect_to_server(server_address, server_port)
+    if paraphrase_function is None and batch_function is None:
+        raise ValueError("Either a paraphrase function or a batch function must be given")
+
+    # When the handler server runs this helper in its own process, it calls the functions itself
+    if capture_helper(function=paraphrase_function, batch_function=batch_function, convert=str):
+        return
+
+    if listen_address is None:
+        listen_address = address_from_argv("--listen")
+
+    def serve_handler(sock: socket.socket) -> None:
+        _serve_handler(sock, paraphrase_function, batch_function)
+
+    if listen_address is not None:
+        # As a daemon, keeping whatever has been loaded between handler servers
+        serve_handlers_at(listen_address, serve_handler)
+        return
+
+    # Connect to the handler server, at the endpoint it gave if it started this helper
+    connect_address = address_from_argv("--connect")
+    if connect_address is not None:
+        sock = Endpoint.parse(connect_address).connect()
+    else:
+        sock = connect_to_server(server_address, server_port)
+    serve_handler(sock)
+    sock.close()
+
+
+def _serve_handler(sock: socket.socket, paraphrase_function: Optional[Callable[[str], str]],
+                   batch_function: Optional[Callable[[List[str]], List[str]]]) -> None:
+    frame_reader = FrameReader(sock)
+
+    # Tell the handler server this helper is ready, as anything it needs is loaded before this function is called
+    sock.sendall(ParaphraserMessages.READY.create_message())
 
     while True:
         # Receive a message from the handler sever
-        indicator = ServerMessages.read_indicator_from(sock)
-        message = indicator.read_rest_of_message_from(sock)
+        message = frame_reader.read_message(ServerMessages)
 
         if message.type == ServerMessages.DATA:
             # Get the string
             string = message.data
 
-            # Paraphrase it
-            paraphrased_string = paraphrase_function(string)
+            # Paraphrase it, or get the error saying why it could not be
+            paraphrased_string, = _paraphrase([string], paraphrase_function, batch_function)
+
+            # Send it back to the handler server, answering the same request ID
+            bytes_to_send = _answer_bytes([message.request_id], [paraphrased_string])
+            sock.sendall(bytes_to_send)
+
+            # Repeat
+            continue
+
+        elif message.type == ServerMessages.BATCH_DATA:
+            # Get the strings
+            strings = message.data
+
+            # Paraphrase them, or get the errors saying why they could not be
+            paraphrased_strings = _paraphrase(strings, paraphrase_function, batch_function)
 
-            # Send it back to the handler server
-            bytes_to_send = ParaphraserMessages.DATA.create_message(paraphrased_string)
+            # Send them back to the handler server, answering the same request IDs
+            bytes_to_send = _answer_bytes(message.request_id, paraphrased_strings)
             sock.sendall(bytes_to_send)
 
             # Repeat
             continue
 
         else:
-            # Because message.type is FINISH we have nothing else to do but terminate
+            # Because message.type is FINISH we have nothing else to do for this handler server
             break
 
-    sock.close()
+
+def _paraphrase(strings: List[str], paraphrase_function: Optional[Callable[[str], str]],
+                batch_function: Optional[Callable[[List[str]], List[str]]]) -> List[Union[str, HelperError]]:
+    # The batch function is used for batches and the paraphrase function, if given, for single texts
+    if batch_function is not None and (len(strings) > 1 or paraphrase_function is None):
+        try:
+            paraphrased_strings = batch_function(strings)
+        except HelperError as e:
+            return [e] * len(strings)
+
+        if len(paraphrased_strings) != len(strings):
+            raise ValueError(f"The batch function returned {len(paraphrased_strings)} paraphrases for "
+                             f"{len(strings)} texts")
+
+        return paraphrased_strings
+
+    paraphrased_strings = []
+    for string in strings:
+        try:
+            paraphrased_strings.append(paraphrase_function(string))
+        except HelperError as e:
+            paraphrased_strings.append(e)
+
+    return paraphrased_strings
+
+
+def _answer_bytes(request_ids: List[int], paraphrased_strings: List[Union[str, HelperError]]) -> bytes:
+    # The paraphrases are sent together, and each error as an ERROR message of its own
+    results = list(zip(request_ids, paraphrased_strings))
+    answered = [(request_id, paraphrased_string) for request_id, paraphrased_string in results
+                if not isinstance(paraphrased_string, HelperError)]
+
+    bytes_to_send = b""
+    if len(answered) == 1:
+        bytes_to_send += ParaphraserMessages.DATA.create_message(*answered[0])
+    elif answered:
+        bytes_to_send += ParaphraserMessages.BATCH_DATA.create_message(
+            [request_id for request_id, _paraphrased_string in answered],
+            [paraphrased_string for _request_id, paraphrased_string in answered]
+        )
+
+    for request_id, paraphrased_string in results:
+        if isinstance(paraphrased_string, HelperError):
+            bytes_to_send += ParaphraserMessages.ERROR.create_message(request_id, paraphrased_string)
+
+    return bytes_to_send
+
+
+def async_paraphraser_server(paraphrase_function: Callable[[str], Awaitable[str]], concurrency_limit: int = 8,
+                             server_address: str = "localhost", server_port: int = 8080,
+                             listen_address: Optional[str] = None) -> None:
+    """
+    A helper function for paraphrasers that spend most of their time waiting, such as on calls to a web API.
+    The same as `paraphraser_server` but takes a coroutine function, and keeps up to `concurrency_limit` calls to it
+     running at once on the one connection.
+    Each result is sent back as soon as it is ready, so results can be in a different order to the requests.
+    The coroutine function can raise a `HelperError` for a text it cannot paraphrase, the same as for
+     `paraphraser_server`.
+
+    The handler server only sends as many requests as its request window allows, so the window should be at least as
+     large as the concurrency limit to keep every call busy.
+
+    :param paraphrase_function:
+        A coroutine function that takes the original text and returns a paraphrased version.
+    :param concurrency_limit: The maximum number of calls to the paraphrase function running at once.
+    :param server_address:
+        The address of the handler server to connect to, unless the handler server started this helper and gave its
+         endpoint after `--connect` on the command line.
+    :param server_port: The port of the handler server to connect to, unless given an endpoint in the same way.
+    :param listen_address:
+        The endpoint to listen on as a daemon, the same as for `paraphraser_server`.
+        As a daemon, several handler servers can be served at once, each with its own concurrency limit.
+    :raises ValueError: If the concurrency limit is less than one.
+    """
+
+    if concurrency_limit < 1:
+        raise ValueError(f"The concurrency limit must be at least 1, got {concurrency_limit}")
+
+    # When the handler server runs this helper in its own process, it calls the coroutine function itself
+    if capture_helper(async_function=paraphrase_function, concurrency_limit=concurrency_limit, convert=str):
+        return
+
+    if listen_address is None:
+        listen_address = address_from_argv("--listen")
+
+    asyncio.run(_async_paraphraser_server(paraphrase_function, concurrency_limit, server_address, server_port,
+                                          listen_address))
+
+
+async def _async_paraphraser_server(paraphrase_function: Callable[[str], Awaitable[str]], concurrency_limit: int,
+                                    server_address: str, server_port: int, listen_address: Optional[str]) -> None:
+    async def serve_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await _async_serve_handler(reader, writer, paraphrase_function, concurrency_limit)
+
+    if listen_address is not None:
+        # As a daemon, keeping whatever has been loaded between handler servers
+        await async_serve_handlers_at(listen_address, serve_handler)
+        return
+
+    # Connect to the handler server, at the endpoint it gave if it started this helper
+    connect_address = address_from_argv("--connect")
+    if connect_address is not None:
+        reader, writer = await Endpoint.parse(connect_address).async_connect()
+    else:
+        reader, writer = await async_connect_to_server(server_address, server_port)
+    await serve_handler(reader, writer)
+
+
+async def _async_serve_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                               paraphrase_function: Callable[[str], Awaitable[str]], concurrency_limit: int) -> None:
+    frame_reader = FrameReader(reader)
+
+    # Tell the handler server this helper is ready, as anything it needs is loaded before this function is called
+    writer.write(ParaphraserMessages.READY.create_message())
+    await writer.drain()
+
+    concurrency_semaphore = asyncio.Semaphore(concurrency_limit)
+    # Only one task can write to the handler server at a time
+    write_lock = asyncio.Lock()
+    tasks = set()
+
+    async def limited_paraphrase(string: str) -> Union[str, HelperError]:
+        async with concurrency_semaphore:
+            try:
+                return await paraphrase_function(string)
+            except HelperError as e:
+                return e
+
+    async def answer(message_bytes: bytes) -> None:
+        async with write_lock:
+            writer.write(message_bytes)
+            await writer.drain()
+
+    async def answer_data(request_id: int, string: str) -> None:
+        paraphrased_string = await limited_paraphrase(string)
+        await answer(_answer_bytes([request_id], [paraphrased_string]))
+
+    async def answer_batch_data(request_ids: List[int], strings: List[str]) -> None:
+        paraphrased_strings = await asyncio.gather(*(limited_paraphrase(string) for string in strings))
+        await answer(_answer_bytes(request_ids, list(paraphrased_strings)))
+
+    def on_task_done(task: asyncio.Task) -> None:
+        tasks.discard(task)
+
+        # Like in paraphraser_server, an exception from the paraphrase function ends the helper, or as a daemon the
+        #  connection to this handler server
+        if not task.cancelled() and task.exception() is not None:
+            failed_tasks.append(task)
+            writer.close()
+
+    failed_tasks = []
+    while True:
+        # Receive a message from the handler sever
+        try:
+            message = await frame_reader.async_read_message(ServerMessages)
+        except ConnectionError:
+            if failed_tasks:
+                raise failed_tasks[0].exception()
+            raise
+
+        if message.type == ServerMessages.DATA:
+            task = asyncio.create_task(answer_data(message.request_id, message.data))
+
+        elif message.type == ServerMessages.BATCH_DATA:
+            task = asyncio.create_task(answer_batch_data(message.request_id, message.data))
+
+        else:
+            # Because message.type is FINISH we only need to finish the requests still being paraphrased
+            break
+
+        # Keep hold of the task until it is done
+        tasks.add(task)
+        task.add_done_callback(on_task_done)
+
+    await asyncio.gather(*tasks)
+
+    writer.close()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import pathlib
+import sqlite3
+from typing import Any, Optional
+
+
+class ResultCache:
+    """
+    A persistent cache of helper results shared between runs.
+
+    Results are keyed by a hash of the text and the helper that produced them, where a helper is identified by the
+     contents of its file and the conda environment it runs in.
+    Changing either gives the helper a new key, so stale results are never returned.
+
+    The cache is kept under a maximum size by evicting the least recently used results.
+    """
+
+    FILE_NAME = "result_cache.sqlite3"
+    """The name of the cache file in the cache directory."""
+
+    def __init__(self, cache_path: pathlib.Path, max_size_bytes: int) -> None:
+        """
+        :param cache_path: The directory to keep the cache in, which is created if it does not exist.
+        :param max_size_bytes: The maximum total size of the cached results.
+        """
+
+        cache_path.mkdir(parents=True, exist_ok=True)
+
+        self.max_size_bytes: int = max_size_bytes
+        """The maximum total size of the cached results."""
+
+        self.hits: int = 0
+        """The number of lookups that found a result."""
+
+        self.misses: int = 0
+        """The number of lookups that did not find a result."""
+
+        self._connection = sqlite3.connect(cache_path / self.FILE_NAME)
+        # Write ahead logging keeps each commit cheap, as a commit is made for every new result
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                                 "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                                 "last_used INTEGER NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._connection.commit()
+
+        self._size_bytes: int
+        self._last_used: int
+        self._size_bytes, self._last_used = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM results").fetchone()
+
+    @staticmethod
+    def helper_key(helper_file: str, conda_env: str) -> str:
+        """
+        Identifies a helper by the contents of its file and its conda environment.
+
+        :param helper_file: The python file run to set up the helper.
+        :param conda_env: The name of the conda environment the helper runs in.
+        :return: The key for the helper's results.
+        """
+
+        helper_hash = hashlib.sha256()
+        helper_hash.update(pathlib.Path(helper_file).read_bytes())
+        helper_hash.update(b"\0" + conda_env.encode("UTF-8"))
+
+        return helper_hash.hexdigest()
+
+    def get(self, helper_key: str, text: str) -> Optional[Any]:
+        """
+        Looks up the result of a helper for a text, marking it as recently used.
+
+        :param helper_key: The key of the helper, from `helper_key`.
+        :param text: The text given to the helper.
+        :return: The cached result, or None if there is none.
+        """
+
+        key = self._key(helper_key, text)
+        row = self._connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._last_used += 1
+        # Committed along with the next result or when closing, losing it in a crash only affects eviction order
+        self._connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (self._last_used, key))
+
+        return json.loads(row[0])
+
+    def put(self, helper_key: str, text: str, value: Any) -> None:
+        """
+        Caches the result of a helper for a text, evicting the least recently used results if the cache is too large.
+
+        :param helper_key: The key of the helper, from `helper_key`.
+        :param text: The text given to the helper.
+        :param value: The result, which must be serialisable as JSON.
+        """
+
+        key = self._key(helper_key, text)
+        value_json = json.dumps(value)
+        size = len(key) + len(value_json.encode("UTF-8"))
+
+        existing = self._connection.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+        if existing is not None:
+            self._size_bytes -= existing[0]
+
+        self._last_used += 1
+        self._connection.execute("INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                                 (key, value_json, size, self._last_used))
+        self._size_bytes += size
+
+        self._evict()
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+    def _evict(self) -> None:
+        while self._size_bytes > self.max_size_bytes:
+            row = self._connection.execute("SELECT key, size FROM results ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+
+            key, size = row
+            self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._size_bytes -= size
+
+    @staticmethod
+    def _key(helper_key: str, text: str) -> str:
+        return hashlib.sha256(helper_key.encode("UTF-8") + b"\0" + text.encode("UTF-8")).hexdigest()
@@ -0,0 +1,213 @@
+import array
+import math
+import pathlib
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _packed_bits(count: int, value: bool = False) -> bytearray:
+    return bytearray(b"\xff" if value else b"\x00") * ((count + 7) // 8)
+
+
+def _get_bit(bits: bytearray, i: int) -> bool:
+    return (bits[i >> 3] >> (i & 7)) & 1 == 1
+
+
+def _set_bit(bits: bytearray, i: int, value: bool) -> None:
+    if value:
+        bits[i >> 3] |= 1 << (i & 7)
+    else:
+        bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+
+class ResultStore:
+    """
+    The results of a run held in columns, rather than a list of Python objects per column.
+
+    The AI percentages are float32 arrays and whether each row is AI generated is a packed bit per row.
+    Each result column has a mask of packed bits marking the rows it is missing for, instead of None placeholders.
+    The texts are kept as lists of strings, with an empty string for a missing paraphrased text, or not at all if the
+     store is only needed for the scores.
+
+    Packed bits are stored eight rows to a byte, with the first row in the lowest bit.
+
+    A result a helper could not give is missing, with the error code and text saying why kept alongside.
+    As few rows should fail, these are kept in a dictionary of the rows that did rather than as columns.
+    """
+
+    COLUMNS = ("original_text", "is_ai", "paraphrased_text", "original_detection", "paraphrased_detection")
+    """Every column, in the order `ResultWriter.write_row` takes them."""
+
+    TEXT_COLUMNS = ("original_text", "paraphrased_text")
+    """The columns of texts."""
+
+    SCORE_COLUMNS = ("original_detection", "paraphrased_detection")
+    """The columns of AI percentages."""
+
+    RESULT_COLUMNS = ("paraphrased_text", "original_detection", "paraphrased_detection")
+    """The columns filled in by the helpers, which can be missing."""
+
+    def __init__(self, row_count: int, keep_texts: bool = True) -> None:
+        """
+        :param row_count: The number of rows, all of which start with every result missing.
+        :param keep_texts: Whether the texts are kept, or only whether the paraphrased texts are missing.
+        """
+
+        self.row_count: int = row_count
+        """The number of rows."""
+
+        self.keep_texts: bool = keep_texts
+        """Whether the texts are kept, or only whether the paraphrased texts are missing."""
+
+        self.original_text: Optional[List[str]] = [""] * row_count if keep_texts else None
+        """The original texts, or None if the texts are not kept."""
+
+        self.paraphrased_text: Optional[List[str]] = [""] * row_count if keep_texts else None
+        """The paraphrased texts, empty if missing, or None if the texts are not kept."""
+
+        self.is_ai: bytearray = _packed_bits(row_count)
+        """Whether each row is AI generated, as packed bits."""
+
+        self.scores: Dict[str, array.array] = {column: array.array("f", [math.nan]) * row_count
+                                               for column in self.SCORE_COLUMNS}
+        """The float32 array of each column of AI percentages, which are NaN if missing."""
+
+        self.missing: Dict[str, bytearray] = {column: _packed_bits(row_count, True) for column in self.RESULT_COLUMNS}
+        """The mask of each result column, as packed bits set for the rows it is missing for."""
+
+        self.errors: Dict[int, Dict[str, Tuple[str, str]]] = {}
+        """The error code and text of each result column a helper could not give a result for, by row."""
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def is_missing(self, column: str, row: int) -> bool:
+        """
+        :param column: The result column.
+        :param row: The row.
+        :return: Whether the column has no result for the row.
+        """
+
+        return _get_bit(self.missing[column], row)
+
+    def get(self, column: str, row: int) -> Any:
+        """
+        :param column: The column.
+        :param row: The row.
+        :return: The value of the column for the row, or None if it is missing.
+        :raises ValueError: If getting a text from a store that does not keep its texts.
+        """
+
+        if column in self.missing and self.is_missing(column, row):
+            return None
+
+        if column == "is_ai":
+            return _get_bit(self.is_ai, row)
+        if column in self.scores:
+            return self.scores[column][row]
+        if not self.keep_texts:
+            raise ValueError("The texts are not kept in this store")
+
+        return getattr(self, column)[row]
+
+    def set(self, column: str, row: int, value: Any) -> None:
+        """
+        Sets the value of a column for a row, marking it as no longer missing.
+        If the texts are not kept, setting a text only marks it as no longer missing.
+
+        :param column: The column.
+        :param row: The row.
+        :param value: The value, which must not be None.
+        """
+
+        if column == "is_ai":
+            _set_bit(self.is_ai, row, value)
+        elif column in self.scores:
+            self.scores[column][row] = value
+        elif self.keep_texts:
+            getattr(self, column)[row] = value
+
+        if column in self.missing:
+            _set_bit(self.missing[column], row, False)
+
+        row_errors = self.errors.get(row)
+        if row_errors is not None and column in row_errors:
+            del row_errors[column]
+            if not row_errors:
+                del self.errors[row]
+
+    def set_error(self, column: str, row: int, code: str, text: str) -> None:
+        """
+        Records that a helper could not give a result column for a row, marking it as missing.
+
+        :param column: The result column.
+        :param row: The row.
+        :param code: The error code from the helper.
+        :param text: The error text from the helper.
+        """
+
+        self.mark_missing(column, row)
+        self.errors.setdefault(row, {})[column] = (code, text)
+
+    def get_error(self, column: str, row: int) -> Optional[Tuple[str, str]]:
+        """
+        :param column: The result column.
+        :param row: The row.
+        :return: The error code and text if a helper could not give the column for the row, otherwise None.
+        """
+
+        return self.errors.get(row, {}).get(column)
+
+    def mark_missing(self, column: str, row: int) -> None:
+        """
+        Marks a result column as missing for a row, leaving its value as it is.
+
+        :param column: The result column.
+        :param row: The row.
+        """
+
+        _set_bit(self.missing[column], row, True)
+
+    def is_finished(self, row: int) -> bool:
+        """
+        :param row: The row.
+        :return: Whether the row has every result, counting a result a helper could not give as settled.
+        """
+
+        row_errors = self.errors.get(row, {})
+        for column in self.RESULT_COLUMNS:
+            if not self.is_missing(column, row) or column in row_errors:
+                continue
+            # A paraphrased text that could not be given is not sent for detection
+            if column == "paraphrased_detection" and "paraphrased_text" in row_errors:
+                continue
+
+            return False
+
+        return True
+
+    def write_columns(self, columns_path: pathlib.Path, relative_to: pathlib.Path) -> Dict[str, dict]:
+        """
+        Writes whether each row is AI generated, the AI percentages and the missing masks to a directory, one file
+         each, for `read_column` in result_writer.py to read.
+        The texts are left to the caller, as they can be too large to hold.
+
+        :param columns_path: The directory to write the files in, which must already exist.
+        :param relative_to: The directory the file paths given are relative to.
+        :return: The manifest entry of each column written, by name, with the mask of a column named `{column}_missing`.
+        """
+
+        columns = {}
+
+        def write(name: str, values: Any, column_type: str) -> None:
+            path = columns_path / f"{name}.{column_type}"
+            with open(path, "wb") as f:
+                f.write(values.tobytes() if isinstance(values, array.array) else values)
+            columns[name] = {"type": column_type, "file": path.relative_to(relative_to).as_posix()}
+
+        write("is_ai", self.is_ai, "bits")
+        for column in self.SCORE_COLUMNS:
+            write(column, self.scores[column], "float32")
+        for column in self.RESULT_COLUMNS:
+            write(f"{column}_missing", self.missing[column], "bits")
+
+        return columns
@@ -0,0 +1,333 @@
+import array
+import hashlib
+import json
+import os
+import pathlib
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from result_store import ResultStore
+
+
+def _text_hash(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("UTF-8")).digest()[:8], "little")
+
+
+def _write_manifest(save_path: pathlib.Path, manifest: dict) -> None:
+    # Replaced in one step, so a reader never sees half a manifest
+    temporary_path = save_path / (ResultWriter.MANIFEST_FILE_NAME + ".tmp")
+    with open(temporary_path, "w", encoding="UTF-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(temporary_path, save_path / ResultWriter.MANIFEST_FILE_NAME)
+
+
+class ResultWriter:
+    """
+    Writes each row of a run to the save directory as soon as it is finished, as a line of JSON, alongside a small
+     manifest describing the files.
+    Rows are written in the order they finish, which need not be the order of the rows.
+    A hash of each written row's original text is kept, so a row only counts as written for the same text, and a row
+     written again replaces the one before it.
+
+    Finalizing writes the rows out again in columns, in order of row, so they can be read without parsing any JSON.
+    The numbers are written from a `ResultStore`, with each text column as a UTF-8 blob and the offset of each text kept
+     separately.
+    Rows that never finished are given empty texts and are marked as missing.
+    A row with results a helper could not give is written as finished, with those results null and the error saying why
+     each could not be given, and once finalized the errors are written together in a small JSON file.
+
+    The manifest says whether the columns have been written and, if so, the number of rows and the file of each column.
+    """
+
+    ROWS_FILE_NAME = "paraphrased_results.jsonl"
+    """The name of the file of finished rows in the save directory."""
+
+    MANIFEST_FILE_NAME = "manifest.json"
+    """The name of the manifest in the save directory."""
+
+    COLUMNS_DIRECTORY_NAME = "columns"
+    """The name of the directory in the save directory that the columns are written to."""
+
+    ERRORS_FILE_NAME = "errors.json"
+    """The name of the file in the columns directory of the results helpers could not give."""
+
+    def __init__(self, save_path: pathlib.Path, resume: bool = False) -> None:
+        """
+        :param save_path: The save directory of the run, which must already exist.
+        :param resume:
+            Whether the run is carrying on from the rows already written to the save directory, otherwise any rows
+             there are written over.
+        """
+
+        self.save_path: pathlib.Path = save_path
+        """The save directory of the run."""
+
+        self.rows_path: pathlib.Path = save_path / self.ROWS_FILE_NAME
+        """The path of the file of finished rows."""
+
+        self.finished_rows: bytearray = bytearray()
+        """A flag for each row up to the last one written, which is 1 if the row has been written."""
+
+        self._text_hashes: array.array = array.array("Q")
+        if resume:
+            self._read_finished_rows()
+
+        self._file = open(self.rows_path, "a" if resume else "w", encoding="UTF-8")
+
+        # A line cut short by a crash is ended, so the next row starts on its own line
+        if self.rows_path.stat().st_size > 0:
+            with open(self.rows_path, "rb") as f:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+        _write_manifest(save_path, {"rows_file": self.ROWS_FILE_NAME, "finalized": False})
+
+    def is_written(self, row: int, original_text: str) -> bool:
+        """
+        :param row: The row to check.
+        :param original_text: The original text of the row.
+        :return: Whether the row has been written for the same original text, by this run or one before it.
+        """
+
+        return (row < len(self.finished_rows) and self.finished_rows[row] == 1
+                and self._text_hashes[row] == _text_hash(original_text))
+
+    def write_row(self, row: int, original_text: str, is_ai: bool, paraphrased_text: Optional[str],
+                  original_detection: Optional[float], paraphrased_detection: Optional[float],
+                  errors: Optional[Dict[str, Tuple[str, str]]] = None) -> None:
+        """
+        Appends a finished row to the file of finished rows, flushing it straight to the file.
+
+        :param row: The row.
+        :param original_text: The original text of the row.
+        :param is_ai: Whether the original text is AI generated.
+        :param paraphrased_text: The paraphrased version of the original text, or None if it could not be given.
+        :param original_detection: The AI percentage of the original text, or None if it could not be given.
+        :param paraphrased_detection: The AI percentage of the paraphrased text, or None if it could not be given.
+        :param errors: The error code and text of each result column a helper could not give, if any.
+        """
+
+        entry = {
+            "row": row,
+            "original_text": original_text,
+            "is_ai": is_ai,
+            "paraphrased_text": paraphrased_text,
+            "original_detection": original_detection,
+            "paraphrased_detection": paraphrased_detection
+        }
+        if errors:
+            entry["errors"] = {column: {"code": code, "text": text} for column, (code, text) in errors.items()}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+        self._mark_written(row, original_text)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def finalize(self) -> int:
+        """
+        Writes the finished rows out in columns and records them in the manifest.
+        Only the numbers and the position of each row's line are held in memory while the texts are copied, not the
+         texts themselves.
+
+        :return: The number of rows written.
+        """
+
+        row_count = len(self.finished_rows)
+        line_offsets = array.array("q", [-1]) * row_count
+        store = ResultStore(row_count, keep_texts=False)
+
+        columns_path = self.save_path / self.COLUMNS_DIRECTORY_NAME
+        columns_path.mkdir(exist_ok=True)
+
+        with open(self.rows_path, "rb") as rows_file:
+            # The numbers are kept in memory, while the texts are left where they are for now
+            line_offset = 0
+            for line in rows_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line of a run that stopped early can be incomplete
+                    line_offset += len(line)
+                    continue
+
+                row = entry["row"]
+                line_offsets[row] = line_offset
+                for column in ("is_ai", *ResultStore.RESULT_COLUMNS):
+                    if entry[column] is not None:
+                        store.set(column, row, entry[column])
+                for column, error in entry.get("errors", {}).items():
+                    store.set_error(column, row, error["code"], error["text"])
+
+                line_offset += len(line)
+
+            # Then the texts are copied over in order of row
+            text_offsets = {column: array.array("Q", [0]) for column in ResultStore.TEXT_COLUMNS}
+            text_files = {column: open(columns_path / f"{column}.utf8", "wb") for column in ResultStore.TEXT_COLUMNS}
+            try:
+                for row in range(row_count):
+                    entry = None
+                    if line_offsets[row] >= 0:
+                        rows_file.seek(line_offsets[row])
+                        entry = json.loads(rows_file.readline())
+
+                    for column in ResultStore.TEXT_COLUMNS:
+                        text = entry[column].encode("UTF-8") if entry is not None and entry[column] else b""
+                        text_files[column].write(text)
+                        text_offsets[column].append(text_offsets[column][-1] + len(text))
+            finally:
+                for text_file in text_files.values():
+                    text_file.close()
+
+        manifest_columns = store.write_columns(columns_path, self.save_path)
+
+        for column in ResultStore.TEXT_COLUMNS:
+            with open(columns_path / f"{column}.offsets.u64", "wb") as f:
+                text_offsets[column].tofile(f)
+            manifest_columns[column] = {"type": "text", "file": f"{self.COLUMNS_DIRECTORY_NAME}/{column}.utf8",
+                                        "offsets_file": f"{self.COLUMNS_DIRECTORY_NAME}/{column}.offsets.u64"}
+
+        errors = [{"row": row, "column": column, "code": code, "text": text}
+                  for row, row_errors in sorted(store.errors.items())
+                  for column, (code, text) in row_errors.items()]
+        with open(columns_path / self.ERRORS_FILE_NAME, "w", encoding="UTF-8") as f:
+            json.dump(errors, f, indent=4)
+
+        _write_manifest(self.save_path, {
+            "rows_file": self.ROWS_FILE_NAME,
+            "finalized": True,
+            "row_count": row_count,
+            "byteorder": sys.byteorder,
+            "columns": manifest_columns,
+            "errors_file": f"{self.COLUMNS_DIRECTORY_NAME}/{self.ERRORS_FILE_NAME}"
+        })
+
+        return row_count
+
+    def _mark_written(self, row: int, original_text: str) -> None:
+        if row >= len(self.finished_rows):
+            self._text_hashes.extend([0] * (row + 1 - len(self.finished_rows)))
+            self.finished_rows.extend(bytes(row + 1 - len(self.finished_rows)))
+        self.finished_rows[row] = 1
+        self._text_hashes[row] = _text_hash(original_text)
+
+    def _read_finished_rows(self) -> None:
+        if not self.rows_path.exists():
+            return
+
+        with open(self.rows_path, "r", encoding="UTF-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be incomplete, from being written when the run stopped
+                    continue
+
+                # A row written again replaces the one before it, the same as when finalizing
+                self._mark_written(entry["row"], entry["original_text"])
+
+
+def read_manifest(save_path: pathlib.Path) -> Optional[dict]:
+    """
+    Reads the manifest written by a `ResultWriter`.
+
+    :param save_path: The save directory of the run.
+    :return: The manifest, or None if there is none.
+    """
+
+    manifest_path = save_path / ResultWriter.MANIFEST_FILE_NAME
+    if not manifest_path.exists():
+        return None
+
+    with open(manifest_path, "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def read_column(save_path: pathlib.Path, column: str) -> array.array:
+    """
+    Reads a column written by `ResultWriter.finalize` without reading any other column.
+    For a text column the offsets of each text within its blob are read instead of the texts, so the length of each
+     text is known without reading it.
+    A column of bits is read as the packed bytes.
+
+    :param save_path: The save directory of the run.
+    :param column: The name of the column.
+    :return: The column, or for a text column the offsets of its texts with one more offset than there are rows.
+    :raises ValueError: If the columns have not been written.
+    """
+
+    manifest = read_manifest(save_path)
+    if manifest is None or not manifest["finalized"]:
+        raise ValueError(f"The results in {save_path} have not been written in columns")
+
+    column_info = manifest["columns"][column]
+    if column_info["type"] == "text":
+        values, path = array.array("Q"), column_info["offsets_file"]
+    else:
+        values, path = array.array("f" if column_info["type"] == "float32" else "B"), column_info["file"]
+
+    with open(save_path / path, "rb") as f:
+        values.frombytes(f.read())
+
+    if manifest["byteorder"] != sys.byteorder:
+        values.byteswap()
+
+    return values
+
+
+def read_errors(save_path: pathlib.Path) -> List[dict]:
+    """
+    Reads the results helpers could not give, as written by `ResultWriter.finalize`.
+
+    :param save_path: The save directory of the run.
+    :return:
+        The row, column, error code and error text of each, in order of row.
+        Empty for results written before errors were recorded.
+    :raises ValueError: If the columns have not been written.
+    """
+
+    manifest = read_manifest(save_path)
+    if manifest is None or not manifest["finalized"]:
+        raise ValueError(f"The results in {save_path} have not been written in columns")
+
+    if "errors_file" not in manifest:
+        return []
+
+    with open(save_path / manifest["errors_file"], "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def read_scores(save_path: pathlib.Path) -> ResultStore:
+    """
+    Reads the columns written by `ResultWriter.finalize` into a store that does not keep the texts, without reading any
+     of the texts.
+    An empty paraphrased text counts as missing, as there is nothing to compare with the original.
+
+    :param save_path: The save directory of the run.
+    :return: The store.
+    :raises ValueError: If the columns have not been written.
+    """
+
+    manifest = read_manifest(save_path)
+    if manifest is None or not manifest["finalized"]:
+        raise ValueError(f"The results in {save_path} have not been written in columns")
+
+    store = ResultStore(manifest["row_count"], keep_texts=False)
+    store.is_ai = bytearray(read_column(save_path, "is_ai"))
+    for column in ResultStore.SCORE_COLUMNS:
+        store.scores[column] = read_column(save_path, column)
+    for column in ResultStore.RESULT_COLUMNS:
+        store.missing[column] = bytearray(read_column(save_path, f"{column}_missing"))
+
+    paraphrased_text_offsets = read_column(save_path, "paraphrased_text")
+    for row in range(store.row_count):
+        # A text is empty if its offset is the same as the next text's
+        if paraphrased_text_offsets[row + 1] == paraphrased_text_offsets[row]:
+            store.mark_missing("paraphrased_text", row)
+
+    for error in read_errors(save_path):
+        store.set_error(error["column"], error["row"], error["code"], error["text"])
+
+    return store
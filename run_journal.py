@@ -0,0 +1,108 @@
+import hashlib
+import json
+import pathlib
+from typing import Any
+
+from result_store import ResultStore
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("UTF-8")).hexdigest()[:16]
+
+
+class RunJournal:
+    """
+    An append-only record of every result as it arrives, kept in the save directory of a run.
+    If the run stops early, the journal can be replayed to fill in the results already paid for, so only the missing
+     ones need to be sent to the helpers again.
+
+    Each line is a JSON object with the row, a hash of the row's original text, the column of the combined data and
+     the value, or the error code and text in place of the value for a result a helper could not give.
+    The hash makes sure a result is only replayed onto the same text it was calculated for.
+    """
+
+    FILE_NAME = "journal.jsonl"
+    """The name of the journal file in the save directory."""
+
+    def __init__(self, save_path: pathlib.Path) -> None:
+        """
+        :param save_path: The save directory of the run, which must already exist.
+        """
+
+        self.path: pathlib.Path = save_path / self.FILE_NAME
+        """The path of the journal file."""
+
+        self._file = open(self.path, "a", encoding="UTF-8")
+
+        # A line cut short by a crash is ended, so the next result starts on its own line
+        if self.path.stat().st_size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def record(self, row: int, original_text: str, column: str, value: Any) -> None:
+        """
+        Appends a result to the journal, flushing it straight to the file.
+
+        :param row: The row of the combined data the result belongs to.
+        :param original_text: The original text of the row.
+        :param column: The column of the combined data the result belongs to.
+        :param value: The result, which must be serialisable as JSON.
+        """
+
+        entry = {"row": row, "text_hash": _text_hash(original_text), "column": column, "value": value}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def record_error(self, row: int, original_text: str, column: str, code: str, text: str) -> None:
+        """
+        Appends a result a helper could not give to the journal, flushing it straight to the file.
+
+        :param row: The row of the combined data the result belongs to.
+        :param original_text: The original text of the row.
+        :param column: The column of the combined data the result belongs to.
+        :param code: The error code from the helper.
+        :param text: The error text from the helper.
+        """
+
+        entry = {"row": row, "text_hash": _text_hash(original_text), "column": column,
+                 "error": {"code": code, "text": text}}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def replay(self, combined_data: ResultStore) -> int:
+        """
+        Fills in the combined data with the results recorded in the journal.
+        Results for rows that no longer exist or whose original text has changed are ignored, as is a last line cut
+         short by a crash.
+
+        :param combined_data: The combined data to fill in.
+        :return: The number of results filled in.
+        """
+
+        replayed = 0
+        with open(self.path, "r", encoding="UTF-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be incomplete, from being written when the run stopped
+                    continue
+
+                row = entry["row"]
+                if row >= len(combined_data):
+                    continue
+                if entry["text_hash"] != _text_hash(combined_data.original_text[row]):
+                    continue
+
+                if "error" in entry:
+                    combined_data.set_error(entry["column"], row, entry["error"]["code"], entry["error"]["text"])
+                else:
+                    combined_data.set(entry["column"], row, entry["value"])
+                replayed += 1
+
+        return replayed
+
+    def close(self) -> None:
+        self._file.close()
@@ -2,11 +2,14 @@ import json
 import os
 import pathlib
 import warnings
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from result_store import ResultStore
+from result_writer import read_manifest, read_scores
+
 _Data = Tuple[List[float], List[float]]
 
 
@@ -130,6 +133,38 @@ def plot_as_probability_density(pre_paraphrased_data: _Data, post_paraphrased_da
     plt.savefig(plots_path / "normal.png", format="png")
 
 
+def load_scores(results_path: pathlib.Path) -> Optional[ResultStore]:
+    """
+    Loads whether each row is AI generated, the AI percentages, whether each row has a paraphrased text and the errors
+     for the results the helpers could not give.
+    Results written in columns are read without reading any of the texts.
+    Older results only have the whole combined data as JSON, which is read instead.
+
+    :param results_path: The save directory of the run.
+    :return: The results without their texts, or None if there are no results.
+    """
+
+    manifest = read_manifest(results_path)
+    if manifest is not None and manifest["finalized"]:
+        return read_scores(results_path)
+
+    results_data_path = results_path / "paraphrased_results.json"
+    if not results_data_path.exists():
+        return None
+
+    with open(results_data_path, "r") as f:
+        results_data = json.loads(f.read())
+
+    results = ResultStore(len(results_data["original_text"]), keep_texts=False)
+    for column in ResultStore.COLUMNS:
+        for i, value in enumerate(results_data[column]):
+            # An empty paraphrased text is left as missing, the same as when read from columns
+            if value is not None and (column != "paraphrased_text" or value):
+                results.set(column, i, value)
+
+    return results
+
+
 def main():
     warnings.simplefilter(action="ignore", category=FutureWarning)
 
@@ -162,15 +197,12 @@ def main():
     print()
     print(f"Using results {working_results_path}")
 
-    results_data_path = working_results_path / "paraphrased_results.json"
+    results = load_scores(working_results_path)
 
-    if not results_data_path.exists():
+    if results is None:
         print("No results data found")
         return
 
-    with open(results_data_path, "r") as f:
-        results_data = json.loads(f.read())
-
     pre_paraphrased_human = []
     pre_paraphrased_machine = []
     post_paraphrased_human = []
@@ -179,19 +211,21 @@ def main():
     human_entries_skipped = 0
     machine_entries_skipped = 0
 
-    for i, (pre_paraphrased_percentage, post_paraphrased_percentage) in \
-            enumerate(zip(results_data["original_detection"], results_data["paraphrased_detection"])):
-        # Skip if there is no paraphrased text
-        # Most likely an error occurred during paraphrasing
-        if not results_data["paraphrased_text"][i]:
-            if results_data["is_ai"][i]:
+    for i in range(len(results)):
+        # Skip if there is no paraphrased text or either AI percentage
+        # Most likely an error occurred during paraphrasing, or the helper could not handle the text
+        if any(results.is_missing(column, i) for column in ResultStore.RESULT_COLUMNS):
+            if results.get("is_ai", i):
                 machine_entries_skipped += 1
             else:
                 human_entries_skipped += 1
 
             continue
 
-        if results_data["is_ai"][i]:
+        pre_paraphrased_percentage = results.get("original_detection", i)
+        post_paraphrased_percentage = results.get("paraphrased_detection", i)
+
+        if results.get("is_ai", i):
             pre_paraphrased_machine.append(pre_paraphrased_percentage)
             post_paraphrased_machine.append(post_paraphrased_percentage)
         else:
@@ -209,9 +243,16 @@ def main():
     plot_as_probability_density(pre_paraphrased_data, post_paraphrased_data, plots_path)
 
     if human_entries_skipped > 0:
-        print(f"{human_entries_skipped} human entrie(s) had no paraphrased text")
+        print(f"{human_entries_skipped} human entrie(s) had no paraphrased text or AI percentage")
     if machine_entries_skipped > 0:
-        print(f"{machine_entries_skipped} machine entrie(s) had no paraphrased text")
+        print(f"{machine_entries_skipped} machine entrie(s) had no paraphrased text or AI percentage")
+
+    error_counts = {}
+    for row_errors in results.errors.values():
+        for code, _text in row_errors.values():
+            error_counts[code] = error_counts.get(code, 0) + 1
+    for code, count in sorted(error_counts.items()):
+        print(f"{count} result(s) could not be given by the helpers with the error {code}")
 
 
 if __name__ == "__main__":